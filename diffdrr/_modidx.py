@@ -6,6 +6,7 @@ d = { 'settings': { 'branch': 'main',
                 'git_url': 'https://github.com/eigenvivek/DiffDRR',
                 'lib_path': 'diffdrr'},
   'syms': { 'diffdrr.data': { 'diffdrr.data.canonicalize': ('api/data.html#canonicalize', 'diffdrr/data.py'),
+                              'diffdrr.data.crop_to_density': ('api/data.html#crop_to_density', 'diffdrr/data.py'),
                               'diffdrr.data.load_example_ct': ('api/data.html#load_example_ct', 'diffdrr/data.py'),
                               'diffdrr.data.read': ('api/data.html#read', 'diffdrr/data.py'),
                               'diffdrr.data.transform_hu_to_density': ('api/data.html#transform_hu_to_density', 'diffdrr/data.py')},
@@ -13,28 +14,68 @@ d = { 'settings': { 'branch': 'main',
                                   'diffdrr.detector.Detector.__init__': ('api/detector.html#detector.__init__', 'diffdrr/detector.py'),
                                   'diffdrr.detector.Detector._initialize_carm': ( 'api/detector.html#detector._initialize_carm',
                                                                                   'diffdrr/detector.py'),
+                                  'diffdrr.detector.Detector._next_subsample': ( 'api/detector.html#detector._next_subsample',
+                                                                                 'diffdrr/detector.py'),
                                   'diffdrr.detector.Detector.calibration': ( 'api/detector.html#detector.calibration',
                                                                              'diffdrr/detector.py'),
                                   'diffdrr.detector.Detector.delx': ('api/detector.html#detector.delx', 'diffdrr/detector.py'),
                                   'diffdrr.detector.Detector.dely': ('api/detector.html#detector.dely', 'diffdrr/detector.py'),
                                   'diffdrr.detector.Detector.forward': ('api/detector.html#detector.forward', 'diffdrr/detector.py'),
                                   'diffdrr.detector.Detector.intrinsic': ('api/detector.html#detector.intrinsic', 'diffdrr/detector.py'),
+                                  'diffdrr.detector.Detector.rays': ('api/detector.html#detector.rays', 'diffdrr/detector.py'),
                                   'diffdrr.detector.Detector.reorient': ('api/detector.html#detector.reorient', 'diffdrr/detector.py'),
                                   'diffdrr.detector.Detector.sdd': ('api/detector.html#detector.sdd', 'diffdrr/detector.py'),
+                                  'diffdrr.detector.Detector.subsample_': ('api/detector.html#detector.subsample_', 'diffdrr/detector.py'),
                                   'diffdrr.detector.Detector.x0': ('api/detector.html#detector.x0', 'diffdrr/detector.py'),
-                                  'diffdrr.detector.Detector.y0': ('api/detector.html#detector.y0', 'diffdrr/detector.py')},
+                                  'diffdrr.detector.Detector.y0': ('api/detector.html#detector.y0', 'diffdrr/detector.py'),
+                                  'diffdrr.detector.RayBundle': ('api/detector.html#raybundle', 'diffdrr/detector.py'),
+                                  'diffdrr.detector.RayBundle.__init__': ('api/detector.html#raybundle.__init__', 'diffdrr/detector.py'),
+                                  'diffdrr.detector.RayBundle.__len__': ('api/detector.html#raybundle.__len__', 'diffdrr/detector.py'),
+                                  'diffdrr.detector.RayBundle.endpoints': ('api/detector.html#raybundle.endpoints', 'diffdrr/detector.py'),
+                                  'diffdrr.detector.RayBundle.n_rays': ('api/detector.html#raybundle.n_rays', 'diffdrr/detector.py'),
+                                  'diffdrr.detector._apply': ('api/detector.html#_apply', 'diffdrr/detector.py'),
+                                  'diffdrr.detector._cache_intrinsics': ('api/detector.html#_cache_intrinsics', 'diffdrr/detector.py'),
+                                  'diffdrr.detector._stratified': ('api/detector.html#_stratified', 'diffdrr/detector.py')},
             'diffdrr.drr': { 'diffdrr.drr.DRR': ('api/drr.html#drr', 'diffdrr/drr.py'),
                              'diffdrr.drr.DRR.__init__': ('api/drr.html#drr.__init__', 'diffdrr/drr.py'),
+                             'diffdrr.drr.DRR._apply': ('api/drr.html#drr._apply', 'diffdrr/drr.py'),
+                             'diffdrr.drr.DRR._density_key': ('api/drr.html#drr._density_key', 'diffdrr/drr.py'),
                              'diffdrr.drr.DRR.affine': ('api/drr.html#drr.affine', 'diffdrr/drr.py'),
                              'diffdrr.drr.DRR.affine_inverse': ('api/drr.html#drr.affine_inverse', 'diffdrr/drr.py'),
+                             'diffdrr.drr.DRR.export': ('api/drr.html#drr.export', 'diffdrr/drr.py'),
+                             'diffdrr.drr.DRR.farm': ('api/drr.html#drr.farm', 'diffdrr/drr.py'),
                              'diffdrr.drr.DRR.forward': ('api/drr.html#drr.forward', 'diffdrr/drr.py'),
                              'diffdrr.drr.DRR.inverse_projection': ('api/drr.html#drr.inverse_projection', 'diffdrr/drr.py'),
+                             'diffdrr.drr.DRR.map_chunks': ('api/drr.html#drr.map_chunks', 'diffdrr/drr.py'),
                              'diffdrr.drr.DRR.n_patches': ('api/drr.html#drr.n_patches', 'diffdrr/drr.py'),
+                             'diffdrr.drr.DRR.occupancy': ('api/drr.html#drr.occupancy', 'diffdrr/drr.py'),
+                             'diffdrr.drr.DRR.occupied_bounds': ('api/drr.html#drr.occupied_bounds', 'diffdrr/drr.py'),
                              'diffdrr.drr.DRR.perspective_projection': ('api/drr.html#drr.perspective_projection', 'diffdrr/drr.py'),
+                             'diffdrr.drr.DRR.plan_chunks': ('api/drr.html#drr.plan_chunks', 'diffdrr/drr.py'),
+                             'diffdrr.drr.DRR.pyramid': ('api/drr.html#drr.pyramid', 'diffdrr/drr.py'),
                              'diffdrr.drr.DRR.render': ('api/drr.html#drr.render', 'diffdrr/drr.py'),
                              'diffdrr.drr.DRR.rescale_detector_': ('api/drr.html#drr.rescale_detector_', 'diffdrr/drr.py'),
                              'diffdrr.drr.DRR.reshape_transform': ('api/drr.html#drr.reshape_transform', 'diffdrr/drr.py'),
                              'diffdrr.drr.DRR.set_intrinsics_': ('api/drr.html#drr.set_intrinsics_', 'diffdrr/drr.py'),
+                             'diffdrr.drr.DRR.stacked': ('api/drr.html#drr.stacked', 'diffdrr/drr.py'),
+                             'diffdrr.drr.DRR.system_matrix': ('api/drr.html#drr.system_matrix', 'diffdrr/drr.py'),
+                             'diffdrr.drr.ExportableDRR': ('api/drr.html#exportabledrr', 'diffdrr/drr.py'),
+                             'diffdrr.drr.ExportableDRR.__init__': ('api/drr.html#exportabledrr.__init__', 'diffdrr/drr.py'),
+                             'diffdrr.drr.ExportableDRR.forward': ('api/drr.html#exportabledrr.forward', 'diffdrr/drr.py'),
+                             'diffdrr.drr.SparseDRR': ('api/drr.html#sparsedrr', 'diffdrr/drr.py'),
+                             'diffdrr.drr.SparseDRR.__init__': ('api/drr.html#sparsedrr.__init__', 'diffdrr/drr.py'),
+                             'diffdrr.drr.SparseDRR.dense': ('api/drr.html#sparsedrr.dense', 'diffdrr/drr.py'),
+                             'diffdrr.drr.SparseDRR.gather': ('api/drr.html#sparsedrr.gather', 'diffdrr/drr.py'),
+                             'diffdrr.drr.SparseDRR.shape': ('api/drr.html#sparsedrr.shape', 'diffdrr/drr.py'),
+                             'diffdrr.drr._bytes_per_sample': ('api/drr.html#_bytes_per_sample', 'diffdrr/drr.py'),
+                             'diffdrr.drr._compact_density': ('api/drr.html#_compact_density', 'diffdrr/drr.py'),
+                             'diffdrr.drr._detector_key': ('api/drr.html#_detector_key', 'diffdrr/drr.py'),
+                             'diffdrr.drr._downsample': ('api/drr.html#_downsample', 'diffdrr/drr.py'),
+                             'diffdrr.drr._init_farm': ('api/drr.html#_init_farm', 'diffdrr/drr.py'),
+                             'diffdrr.drr._parse_memory': ('api/drr.html#_parse_memory', 'diffdrr/drr.py'),
+                             'diffdrr.drr._ray_length': ('api/drr.html#_ray_length', 'diffdrr/drr.py'),
+                             'diffdrr.drr._render_farm': ('api/drr.html#_render_farm', 'diffdrr/drr.py'),
+                             'diffdrr.drr._stack': ('api/drr.html#_stack', 'diffdrr/drr.py'),
                              'diffdrr.drr.reshape_subsampled_drr': ('api/drr.html#reshape_subsampled_drr', 'diffdrr/drr.py')},
             'diffdrr.metrics': { 'diffdrr.metrics.DoubleGeodesicSE3': ('api/metrics.html#doublegeodesicse3', 'diffdrr/metrics.py'),
                                  'diffdrr.metrics.DoubleGeodesicSE3.__init__': ( 'api/metrics.html#doublegeodesicse3.__init__',
@@ -74,6 +115,8 @@ d = { 'settings': { 'branch': 'main',
                                  'diffdrr.metrics.Sobel': ('api/metrics.html#sobel', 'diffdrr/metrics.py'),
                                  'diffdrr.metrics.Sobel.__init__': ('api/metrics.html#sobel.__init__', 'diffdrr/metrics.py'),
                                  'diffdrr.metrics.Sobel.forward': ('api/metrics.html#sobel.forward', 'diffdrr/metrics.py'),
+                                 'diffdrr.metrics.is_sparse': ('api/metrics.html#is_sparse', 'diffdrr/metrics.py'),
+                                 'diffdrr.metrics.sparse_to_images': ('api/metrics.html#sparse_to_images', 'diffdrr/metrics.py'),
                                  'diffdrr.metrics.to_patches': ('api/metrics.html#to_patches', 'diffdrr/metrics.py')},
             'diffdrr.pose': { 'diffdrr.pose.RigidTransform': ('api/pose.html#rigidtransform', 'diffdrr/pose.py'),
                               'diffdrr.pose.RigidTransform.__getitem__': ('api/pose.html#rigidtransform.__getitem__', 'diffdrr/pose.py'),
@@ -153,20 +196,71 @@ d = { 'settings': { 'branch': 'main',
                                                                                          'diffdrr/registration.py')},
             'diffdrr.renderers': { 'diffdrr.renderers.Siddon': ('api/renderers.html#siddon', 'diffdrr/renderers.py'),
                                    'diffdrr.renderers.Siddon.__init__': ('api/renderers.html#siddon.__init__', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers.Siddon._raytrace': ('api/renderers.html#siddon._raytrace', 'diffdrr/renderers.py'),
                                    'diffdrr.renderers.Siddon.dims': ('api/renderers.html#siddon.dims', 'diffdrr/renderers.py'),
                                    'diffdrr.renderers.Siddon.forward': ('api/renderers.html#siddon.forward', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers.SystemMatrix': ('api/renderers.html#systemmatrix', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers.SystemMatrix.__init__': ( 'api/renderers.html#systemmatrix.__init__',
+                                                                                'diffdrr/renderers.py'),
+                                   'diffdrr.renderers.SystemMatrix.forward': ( 'api/renderers.html#systemmatrix.forward',
+                                                                               'diffdrr/renderers.py'),
+                                   'diffdrr.renderers.SystemMatrix.load': ('api/renderers.html#systemmatrix.load', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers.SystemMatrix.nnz': ('api/renderers.html#systemmatrix.nnz', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers.SystemMatrix.save': ('api/renderers.html#systemmatrix.save', 'diffdrr/renderers.py'),
                                    'diffdrr.renderers.Trilinear': ('api/renderers.html#trilinear', 'diffdrr/renderers.py'),
                                    'diffdrr.renderers.Trilinear.__init__': ( 'api/renderers.html#trilinear.__init__',
                                                                              'diffdrr/renderers.py'),
                                    'diffdrr.renderers.Trilinear.dims': ('api/renderers.html#trilinear.dims', 'diffdrr/renderers.py'),
                                    'diffdrr.renderers.Trilinear.forward': ('api/renderers.html#trilinear.forward', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._RecomputeSiddon': ('api/renderers.html#_recomputesiddon', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._RecomputeSiddon.backward': ( 'api/renderers.html#_recomputesiddon.backward',
+                                                                                    'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._RecomputeSiddon.forward': ( 'api/renderers.html#_recomputesiddon.forward',
+                                                                                   'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._SparseMatmul': ('api/renderers.html#_sparsematmul', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._SparseMatmul.backward': ( 'api/renderers.html#_sparsematmul.backward',
+                                                                                 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._SparseMatmul.forward': ( 'api/renderers.html#_sparsematmul.forward',
+                                                                                'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._arange': ('api/renderers.html#_arange', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._axes': ('api/renderers.html#_axes', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._box_bounds': ('api/renderers.html#_box_bounds', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._cache_constant': ('api/renderers.html#_cache_constant', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._check_lookup': ('api/renderers.html#_check_lookup', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._constant': ('api/renderers.html#_constant', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._corank': ('api/renderers.html#_corank', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._csr': ('api/renderers.html#_csr', 'diffdrr/renderers.py'),
                                    'diffdrr.renderers._filter_intersections_outside_volume': ( 'api/renderers.html#_filter_intersections_outside_volume',
                                                                                                'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._gather': ('api/renderers.html#_gather', 'diffdrr/renderers.py'),
                                    'diffdrr.renderers._get_alpha_minmax': ('api/renderers.html#_get_alpha_minmax', 'diffdrr/renderers.py'),
                                    'diffdrr.renderers._get_alphas': ('api/renderers.html#_get_alphas', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._get_alphas_dda': ('api/renderers.html#_get_alphas_dda', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._get_occupancy': ('api/renderers.html#_get_occupancy', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._get_occupied_bounds': ( 'api/renderers.html#_get_occupied_bounds',
+                                                                               'diffdrr/renderers.py'),
                                    'diffdrr.renderers._get_voxel': ('api/renderers.html#_get_voxel', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._get_voxel_and_channel': ( 'api/renderers.html#_get_voxel_and_channel',
+                                                                                 'diffdrr/renderers.py'),
                                    'diffdrr.renderers._get_xyzs': ('api/renderers.html#_get_xyzs', 'diffdrr/renderers.py'),
-                                   'diffdrr.renderers.reduce': ('api/renderers.html#reduce', 'diffdrr/renderers.py')},
+                                   'diffdrr.renderers._load_entry_point': ('api/renderers.html#_load_entry_point', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._merge_alphas': ('api/renderers.html#_merge_alphas', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._n_channels': ('api/renderers.html#_n_channels', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._pack': ('api/renderers.html#_pack', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._ray_chunks': ('api/renderers.html#_ray_chunks', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._sample': ('api/renderers.html#_sample', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._siddon_system_matrix': ( 'api/renderers.html#_siddon_system_matrix',
+                                                                                'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._slice_bounds': ('api/renderers.html#_slice_bounds', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._take': ('api/renderers.html#_take', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers._test_rays': ('api/renderers.html#_test_rays', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers.benchmark_renderer': ( 'api/renderers.html#benchmark_renderer',
+                                                                             'diffdrr/renderers.py'),
+                                   'diffdrr.renderers.check_renderer': ('api/renderers.html#check_renderer', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers.get_renderer': ('api/renderers.html#get_renderer', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers.reduce': ('api/renderers.html#reduce', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers.reduce_packed': ('api/renderers.html#reduce_packed', 'diffdrr/renderers.py'),
+                                   'diffdrr.renderers.register_renderer': ('api/renderers.html#register_renderer', 'diffdrr/renderers.py')},
             'diffdrr.utils': { 'diffdrr.utils.get_focal_length': ('api/utils.html#get_focal_length', 'diffdrr/utils.py'),
                                'diffdrr.utils.get_pinhole_camera': ('api/utils.html#get_pinhole_camera', 'diffdrr/utils.py'),
                                'diffdrr.utils.get_principal_point': ('api/utils.html#get_principal_point', 'diffdrr/utils.py'),
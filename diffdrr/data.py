@@ -9,10 +9,10 @@ import numpy as np
 import pandas as pd
 import torch
 from torchio import LabelMap, ScalarImage, Subject
-from torchio.transforms import Resample
+from torchio.transforms import Crop, Resample
 
 # %% auto 0
-__all__ = ['load_example_ct', 'read']
+__all__ = ['load_example_ct', 'read', 'crop_to_density']
 
 # %% ../notebooks/api/03_data.ipynb 5
 def load_example_ct(
@@ -49,6 +49,7 @@ def read(
     fiducials: torch.Tensor = None,  # 3D fiducials in world coordinates
     transform: RigidTransform = None,  # RigidTransform to apply to the volume's affine
     center_volume: bool = True,  # Move the volume's isocenter to the world origin
+    crop: bool = False,  # Crop the volumes to the bounding box of voxels with nonzero density
     **kwargs,  # Any additional information to be stored in the torchio.Subject
 ) -> Subject:
     """
@@ -140,6 +141,10 @@ def read(
         )
         subject.density.data = subject.density.data * mask
 
+    # Crop the air (or the structures that are not rendered) around the volume
+    if crop:
+        subject = crop_to_density(subject)
+
     return subject
 
 # %% ../notebooks/api/03_data.ipynb 7
@@ -173,6 +178,25 @@ def canonicalize(subject):
     return subject
 
 # %% ../notebooks/api/03_data.ipynb 8
+def crop_to_density(subject, margin=0):
+    """Crop every image in the subject to the bounding box of the voxels with nonzero density."""
+    density = subject.density.data.squeeze() > 0
+    if not density.any():
+        return subject
+
+    # Find the first and last nonzero slice along each axis (padded by a margin)
+    cropping = []
+    for dim in range(3):
+        other = [d for d in range(3) if d != dim]
+        idxs = density.any(dim=other).nonzero()
+        lo = max(idxs.min().item() - margin, 0)
+        hi = min(idxs.max().item() + margin, density.shape[dim] - 1)
+        cropping += [lo, density.shape[dim] - 1 - hi]
+
+    # torchio updates the affine of every image such that world coordinates are unchanged
+    return Crop(cropping)(subject)
+
+# %% ../notebooks/api/03_data.ipynb 9
 def transform_hu_to_density(volume, bone_attenuation_multiplier):
     # volume can be loaded as int16, need to convert to float32 to use float bone_attenuation_multiplier
     volume = volume.to(torch.float32)
@@ -3,17 +3,23 @@
 # %% ../notebooks/api/02_detector.ipynb 3
 from __future__ import annotations
 
+import math
+
 import torch
 from fastcore.basics import patch
 from torch.nn.functional import normalize
 
 # %% auto 0
-__all__ = ['Detector']
+__all__ = ['Detector', 'RayBundle']
 
 # %% ../notebooks/api/02_detector.ipynb 5
+from collections import deque
+
 from .pose import RigidTransform
 from .utils import make_intrinsic_matrix
 
+_SUBSAMPLE_HISTORY = 8  # Number of past subsamples kept by the detector
+
 
 class Detector(torch.nn.Module):
     """Construct a 6 DoF X-ray detector system. This model is based on a C-Arm."""
@@ -30,15 +36,32 @@ class Detector(torch.nn.Module):
         reorient: torch.tensor,  # Frame-of-reference change matrix
         n_subsample: int | None = None,  # Number of target points to randomly sample
         reverse_x_axis: bool = False,  # If pose includes reflection (in E(3) not SE(3)), reverse x-axis
+        subsample: str = "random",  # Pattern of the subsampled target points, either "random" or "stratified"
+        resample_every: (
+            int | None
+        ) = None,  # Draw new target points every this many renders (if None, only draw them once)
+        subsample_per_pose: bool = False,  # Draw independent target points for each pose in the batch
+        seed: int | None = None,  # Seed for the subsampled target points
     ):
         super().__init__()
         self.height = height
         self.width = width
-        self.n_subsample = n_subsample
-        if self.n_subsample is not None:
-            self.subsamples = []
         self.reverse_x_axis = reverse_x_axis
 
+        # Optionally, only cast rays through a random subset of the pixels
+        if subsample not in ["random", "stratified"]:
+            raise ValueError(
+                f"subsample must be 'random' or 'stratified', not {subsample}"
+            )
+        self.n_subsample = n_subsample
+        self.subsample = subsample
+        self.resample_every = resample_every
+        self.subsample_per_pose = subsample_per_pose
+        self.seed = seed
+        self._generator = None if seed is None else torch.Generator().manual_seed(seed)
+        self._n_renders = 0
+        self.subsamples = deque(maxlen=_SUBSAMPLE_HISTORY)
+
         # Initialize the source and detector plane in default positions (along the x-axis)
         source, target = self._initialize_carm()
         self.register_buffer("source", source)
@@ -60,25 +83,35 @@ class Detector(torch.nn.Module):
             ),
         )
 
+        # Cache the intrinsic parameters as Python scalars (and the intrinsic matrix), such that reading
+        # them doesn't sync the device. The cache is refreshed whenever a state dict is loaded.
+        self.register_buffer("_intrinsic", None, persistent=False)
+        _cache_intrinsics(self)
+        self.register_load_state_dict_post_hook(_cache_intrinsics)
+
+        # Draw the first subset of target points
+        if n_subsample is not None:
+            self.subsample_()
+
     @property
     def sdd(self):
-        return self._calibration[2, 2].item()
+        return self._sdd
 
     @property
     def delx(self):
-        return self._calibration[1, 1].item()
+        return self._delx
 
     @property
     def dely(self):
-        return self._calibration[0, 0].item()
+        return self._dely
 
     @property
     def x0(self):
-        return -self._calibration[1, -1].item()
+        return self._x0
 
     @property
     def y0(self):
-        return -self._calibration[0, -1].item()
+        return self._y0
 
     @property
     def reorient(self):
@@ -92,15 +125,19 @@ class Detector(torch.nn.Module):
     @property
     def intrinsic(self):
         """The 3x3 intrinsic matrix."""
-        return make_intrinsic_matrix(
-            self.sdd,
-            self.delx,
-            self.dely,
-            self.width,
-            self.height,
-            self.y0,
-            self.x0,
-        ).to(self.source)
+        return self._intrinsic
+
+
+def _cache_intrinsics(detector, incompatible_keys=None):
+    """Read the intrinsic parameters from the calibration matrix of a detector."""
+    (dely, _, _, y0), (_, delx, _, x0), (_, _, sdd, _), _ = (
+        detector._calibration.tolist()
+    )
+    detector._sdd, detector._delx, detector._dely = sdd, delx, dely
+    detector._x0, detector._y0 = -x0, -y0
+    detector._intrinsic = make_intrinsic_matrix(
+        sdd, delx, dely, detector.width, detector.height, -y0, -x0
+    ).to(detector._calibration)
 
 # %% ../notebooks/api/02_detector.ipynb 6
 @patch
@@ -135,25 +172,163 @@ def _initialize_carm(self: Detector):
     # Add a batch dimension to the source and target so multiple poses can be passed at once
     source = source.unsqueeze(0)
     target = target.unsqueeze(0)
-
-    if self.n_subsample is not None:
-        sample = torch.randperm(self.height * self.width)[: int(self.n_subsample)]
-        target = target[:, sample, :]
-        self.subsamples.append(sample.tolist())
     return source, target
 
 # %% ../notebooks/api/02_detector.ipynb 7
+@patch
+def subsample_(self: Detector, batch_size: int = 1):
+    """Draw a new subset of target points (inplace) and return its indices."""
+    n_draws = batch_size if self.subsample_per_pose else 1
+    n_pixels = self.height * self.width
+    n_subsample = int(self.n_subsample)
+    if self.subsample == "stratified":
+        idxs = _stratified(
+            self.height, self.width, n_subsample, n_draws, self._generator
+        )
+    elif n_draws == 1:
+        idxs = torch.randperm(n_pixels, generator=self._generator)[:n_subsample]
+    else:
+        scores = torch.rand(n_draws, n_pixels, generator=self._generator)
+        idxs = scores.topk(n_subsample, dim=-1, sorted=False).indices
+    batch = (batch_size,) if self.subsample_per_pose else ()
+    idxs = idxs.view(*batch, -1).to(self.source.device)
+    self.subsamples.append(idxs)
+    return idxs
+
+
+@patch
+def _next_subsample(self: Detector, batch_size: int):
+    """Get the indices of the target points for the next render, drawing new ones when it is time to resample."""
+    batch = (batch_size,) if self.subsample_per_pose else ()
+    stale = self.subsamples[-1].shape[:-1] != batch
+    if self.resample_every is not None and self._n_renders > 0:
+        stale = stale or self._n_renders % self.resample_every == 0
+    self._n_renders += 1
+    if stale:
+        return self.subsample_(batch_size)
+    if self.subsamples[-1].device != self.source.device:
+        self.subsamples[-1] = self.subsamples[-1].to(self.source.device)
+    return self.subsamples[-1]
+
+
+def _stratified(height, width, n_subsample, n_draws, generator):
+    """Jitter one target point in each cell of a grid of (about) `n_subsample` cells."""
+    rows = min(max(round((n_subsample * height / width) ** 0.5), 1), height)
+    cols = min(math.ceil(n_subsample / rows), width)
+    rows = min(math.ceil(n_subsample / cols), height)
+
+    # Draw a random pixel from each cell
+    r = torch.linspace(0, height, rows + 1).floor()
+    c = torch.linspace(0, width, cols + 1).floor()
+    r0, c0 = torch.cartesian_prod(r[:-1], c[:-1]).unbind(-1)
+    r1, c1 = torch.cartesian_prod(r[1:], c[1:]).unbind(-1)
+    u = torch.rand(n_draws, 2, rows * cols, generator=generator)
+    row = (r0 + u[:, 0] * (r1 - r0)).long()
+    col = (c0 + u[:, 1] * (c1 - c0)).long()
+    idxs = row * width + col
+
+    # Drop random cells if there are more cells than target points
+    keep = torch.rand(n_draws, rows * cols, generator=generator)
+    keep = keep.topk(n_subsample, dim=-1, sorted=False).indices
+    return idxs.gather(-1, keep).sort(dim=-1).values
+
+# %% ../notebooks/api/02_detector.ipynb 8
 from .pose import RigidTransform
 
 
+class RayBundle:
+    """
+    A batch of X-rays cast from a source to the pixels of a detector plane.
+    Rays are stored implicitly as a pose and the source / target points in the
+    frame of the detector, which are shared by every pose in the batch. Their
+    endpoints are only computed for the chunk of poses and pixels that is being
+    rendered, by a single 4x4 matrix that fuses every transform along the way.
+    """
+
+    def __init__(
+        self,
+        source: torch.Tensor,  # Source points, shape (1 or B, 1, 3)
+        target: torch.Tensor,  # Target points, shape (1 or B, N, 3)
+        pose: (
+            RigidTransform | None
+        ) = None,  # Pose mapping the points to world coordinates (if None, they already are)
+        calibration: (
+            RigidTransform | None
+        ) = None,  # Calibration applied to the target points before the pose
+    ):
+        self.source = source
+        self.target = target
+        self.pose = pose
+        self.calibration = calibration
+
+    def __len__(self):
+        if self.pose is not None:
+            return len(self.pose)
+        return max(len(self.source), len(self.target))
+
+    @property
+    def n_rays(self):
+        """The number of rays cast for each pose."""
+        return self.target.shape[1]
+
+    def endpoints(
+        self,
+        poses: slice = slice(None),  # Poses of the chunk
+        pixels: slice = slice(None),  # Pixels of the chunk
+        transform: (
+            RigidTransform | None
+        ) = None,  # Transform applied after the pose (e.g., world to voxel)
+    ):
+        """Source and target points of a chunk of rays (in world coordinates, unless a transform is given)."""
+        source = self.source if len(self.source) == 1 else self.source[poses]
+        if len(self.target) == 1:
+            target = self.target[:, pixels]
+        else:
+            target = self.target[poses, pixels]
+
+        # Compose the transforms in double precision and apply them once
+        matrix = None
+        if self.pose is not None:
+            matrix = self.pose.matrix[poses].double()
+        if transform is not None:
+            T = transform.matrix.double()
+            matrix = T if matrix is None else T @ matrix
+        if matrix is not None:
+            source = _apply(matrix, source)
+        if self.calibration is not None:
+            C = self.calibration.matrix
+            C = (C if len(C) == 1 else C[poses]).double()
+            matrix = C if matrix is None else matrix @ C
+        if matrix is not None:
+            target = _apply(matrix, target)
+        return source, target
+
+
+def _apply(matrix: torch.Tensor, x: torch.Tensor):
+    """Apply a batch of 4x4 matrices to a batch of points, in the dtype of the points."""
+    matrix = matrix.to(x)
+    # A matmul (unlike einsum) returns contiguous points, which grid_sample is much faster on
+    return x @ matrix[:, :3, :3].mT + matrix[:, None, :3, 3]
+
+
 @patch
-def forward(self: Detector, extrinsic: RigidTransform, calibration: RigidTransform):
-    """Create source and target points for X-rays to trace through the volume."""
+def rays(self: Detector, extrinsic: RigidTransform, calibration: RigidTransform):
+    """Create a bundle of X-rays without computing the world coordinates of every target point."""
     if calibration is None:
-        target = self.calibration(self.target)
+        calibration = self.calibration
+
+    # Optionally, only cast rays through a subset of the pixels
+    if self.n_subsample is None:
+        target = self.target
     else:
-        target = calibration(self.target)
-    pose = self.reorient.compose(extrinsic)
-    source = pose(self.source)
-    target = pose(target)
-    return source, target
+        idxs = self._next_subsample(len(extrinsic))
+        target = self.target[:, idxs] if idxs.dim() == 1 else self.target[0, idxs]
+
+    pose = RigidTransform(extrinsic.matrix.double() @ self._reorient.double())
+    return RayBundle(self.source, target, pose, calibration)
+
+
+@patch
+def forward(self: Detector, extrinsic: RigidTransform, calibration: RigidTransform):
+    """Create source and target points for X-rays to trace through the volume."""
+    return self.rays(extrinsic, calibration).endpoints()
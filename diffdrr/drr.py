@@ -3,16 +3,21 @@
 # %% ../notebooks/api/00_drr.ipynb 3
 from __future__ import annotations
 
+import math
+
 import numpy as np
 import torch
 import torch.nn as nn
 from fastcore.basics import patch
+from torch.nn.functional import avg_pool3d, pad
 
 from .detector import Detector
-from .renderers import Siddon, Trilinear
+from .renderers import Siddon, SystemMatrix, Trilinear, get_renderer
+from .renderers import _get_occupancy, _get_occupied_bounds, _n_channels
+from .renderers import _siddon_system_matrix
 
 # %% auto 0
-__all__ = ['DRR']
+__all__ = ['DRR', 'SparseDRR', 'ExportableDRR']
 
 # %% ../notebooks/api/00_drr.ipynb 7
 from torchio import Subject
@@ -34,10 +39,34 @@ class DRR(nn.Module):
         x0: float = 0.0,  # Principal point X-offset
         y0: float = 0.0,  # Principal point Y-offset
         p_subsample: float | None = None,  # Proportion of pixels to randomly subsample
+        subsample: str = "random",  # Pattern of the subsampled pixels, either "random" or "stratified"
+        resample_every: (
+            int | None
+        ) = None,  # Draw new subsampled pixels every this many renders (if None, only draw them once)
+        subsample_per_pose: bool = False,  # Draw independent subsampled pixels for each pose in the batch
+        subsample_seed: int | None = None,  # Seed for the subsampled pixels
         reshape: bool = True,  # Return DRR with shape (b, 1, h, w)
+        sparse: bool = False,  # If subsampling, return a SparseDRR of the rendered pixels instead of a dense DRR
         reverse_x_axis: bool = True,  # If True, obey radiologic convention (e.g., heart on right)
         patch_size: int | None = None,  # Render patches of the DRR in series
-        renderer: str = "siddon",  # Rendering backend, either "siddon" or "trilinear"
+        max_memory: (
+            int | str | None
+        ) = None,  # Memory budget (e.g., "2GB") for rendering chunks of poses and pixels in series
+        checkpoint_patches: bool = False,  # Recompute each patch in the backward pass instead of storing its graph
+        n_workers: (
+            int | None
+        ) = None,  # Render chunks of poses and pixels in parallel on a pool of CPU threads
+        n_threads: (
+            int | None
+        ) = None,  # Intra-op threads per worker (default: split `torch.get_num_threads()` among workers)
+        stack_mask: bool = False,  # Stack the mask with the density to sample both in a single pass
+        brick_size: (
+            int | None
+        ) = None,  # Skip empty bricks of this many voxels at the ends of each ray
+        occupancy_threshold: float = 0.0,  # Bricks whose density is at most this value are empty
+        density_dtype: torch.dtype = torch.float32,  # Storage dtype of the density (float32, float16, bfloat16, or uint16), compact dtypes are always sampled with lookup="gather"
+        mask_dtype: torch.dtype = torch.float32,  # Storage dtype of the mask (e.g., uint8 or int16)
+        renderer: str = "siddon",  # Name of a registered renderer (e.g., "siddon" or "trilinear")
         persistent: bool = True,  # Set persistent value in `torch.nn.Module.register_buffer`
         **renderer_kwargs,  # Kwargs for the renderer
     ):
@@ -61,6 +90,10 @@ class DRR(nn.Module):
             subject.reorient,
             reverse_x_axis=reverse_x_axis,
             n_subsample=n_subsample,
+            subsample=subsample,
+            resample_every=resample_every,
+            subsample_per_pose=subsample_per_pose,
+            seed=subsample_seed,
         )
 
         # Initialize the volume and world geometry
@@ -75,32 +108,64 @@ class DRR(nn.Module):
             self._affine.inverse(),
             persistent=persistent,
         )
+        density, scale = _compact_density(subject.density.data.squeeze(), density_dtype)
         self.register_buffer(
             "density",
-            subject.density.data.squeeze(),
+            density,
             persistent=persistent,
         )
+        if scale is not None:
+            self.register_buffer("_density_scale", scale, persistent=persistent)
         if subject.mask is not None:
             self.register_buffer(
                 "mask",
-                subject.mask.data.to(torch.float32).squeeze(),
+                subject.mask.data.to(mask_dtype).squeeze(),
                 persistent=persistent,
             )
 
-        # Initialize the renderer
-        if renderer == "siddon":
-            self.renderer = Siddon(**renderer_kwargs)
-        elif renderer == "trilinear":
-            self.renderer = Trilinear(**renderer_kwargs)
+        # Count the structures in the mask once, instead of on every render
+        if subject.mask is not None:
+            self.n_channels = _n_channels(self.density, self.mask)
         else:
-            raise ValueError(
-                f"renderer must be 'siddon' or 'trilinear', not {renderer}"
-            )
+            self.n_channels = None
+
+        # Initialize the renderer
+        self.renderer = get_renderer(renderer, **renderer_kwargs)
         self.reshape = reshape
+        self.sparse = sparse
+        if patch_size is not None and max_memory is not None:
+            raise ValueError("Only one of patch_size and max_memory can be set")
         self.patch_size = patch_size
+        self.max_memory = _parse_memory(max_memory)
+        self.checkpoint_patches = checkpoint_patches
+        self.n_workers = n_workers
+        self.n_threads = n_threads
+        self.stack_mask = stack_mask
+        self._stacked = None
+        self._pyramid = {}
+        self._detectors = {}
+
+        # Optionally, initialize a coarse grid of the bricks in the volume that are not empty
+        self.brick_size = brick_size
+        self.occupancy_threshold = occupancy_threshold
+        if brick_size is not None:
+            self.register_buffer(
+                "_occupancy",
+                _get_occupancy(
+                    self.density,
+                    brick_size,
+                    occupancy_threshold,
+                    getattr(self, "_density_scale", None),
+                ),
+                persistent=False,
+            )
+            self._occupancy_key = self._density_key(self.density)
 
     def reshape_transform(self, img, batch_size):
-        if self.reshape:
+        if self.sparse and self.detector.n_subsample is not None:
+            idxs = self.detector.subsamples[-1]
+            img = SparseDRR(img, idxs, self.detector.height, self.detector.width)
+        elif self.reshape:
             if self.detector.n_subsample is None:
                 img = img.view(
                     batch_size,
@@ -122,17 +187,96 @@ class DRR(nn.Module):
 
     @property
     def n_patches(self):
-        return (self.detector.height * self.detector.width) // (self.patch_size**2)
+        return math.ceil(
+            self.detector.height * self.detector.width / self.patch_size**2
+        )
 
 # %% ../notebooks/api/00_drr.ipynb 8
+class SparseDRR:
+    """The values of a DRR at the subset of its pixels that were rendered."""
+
+    def __init__(
+        self,
+        values: torch.Tensor,  # Rendered values, shape (B, C, n)
+        indices: torch.Tensor,  # Flattened pixel indices, shape (n,) or (B, n)
+        height: int,  # Height of the dense DRR
+        width: int,  # Width of the dense DRR
+    ):
+        self.values = values
+        self.indices = indices
+        self.height = height
+        self.width = width
+
+    @property
+    def shape(self):
+        """The shape of the dense DRR."""
+        return torch.Size([*self.values.shape[:2], self.height, self.width])
+
+    def gather(self, img: torch.Tensor):
+        """Sample a dense image of shape (B, C, H, W) at the pixels of the DRR."""
+        img = img.flatten(-2)
+        if self.indices.dim() == 1:
+            return img[..., self.indices]
+        B, C = self.values.shape[:2]
+        idxs = self.indices.unsqueeze(1).expand(-1, C, -1)
+        return img.expand(B, C, -1).gather(-1, idxs)
+
+    def dense(self):
+        """Scatter the values into a dense DRR of shape (B, C, H, W) that is zero elsewhere."""
+        B, C, n = self.values.shape
+        idxs = self.indices.expand(B, -1).unsqueeze(1).expand(-1, C, -1)
+        img = torch.zeros(B, C, self.height * self.width).to(self.values)
+        img = img.scatter(-1, idxs, self.values)
+        return img.view(B, C, self.height, self.width)
+
+# %% ../notebooks/api/00_drr.ipynb 9
 def reshape_subsampled_drr(img: torch.Tensor, detector: Detector, batch_size: int):
-    n_points = detector.height * detector.width
-    drr = torch.zeros(batch_size, n_points).to(img)
-    drr[:, detector.subsamples[-1]] = img
-    drr = drr.view(batch_size, 1, detector.height, detector.width)
-    return drr
+    idxs = detector.subsamples[-1]
+    return SparseDRR(img, idxs, detector.height, detector.width).dense()
+
+
+def _compact_density(density: torch.Tensor, dtype: torch.dtype):
+    """Store the density in a compact dtype, returning the scale to dequantize integer dtypes."""
+    if dtype in [torch.float32, torch.float64, torch.float16, torch.bfloat16]:
+        return density.to(dtype), None
+    if dtype != torch.uint16:
+        raise ValueError(
+            f"density_dtype must be float32, float16, bfloat16, or uint16, not {dtype}"
+        )
+    if density.min() < 0:
+        raise ValueError(
+            "Quantizing the density to uint16 requires it to be nonnegative"
+        )
+
+    # Quantize without an offset so air (i.e., zero density) stays exactly zero
+    scale = density.max() / torch.iinfo(torch.uint16).max
+    scale = torch.where(scale > 0, scale, 1.0)
+    density = (density / scale).round().to(torch.uint16)
+    return density, scale.to(torch.float32)
+
+
+def _downsample(volume: torch.Tensor, factor: int):
+    """Average a volume in blocks of `factor`^3 voxels, zero-padding the blocks on its far edges."""
+    X, Y, Z = volume.shape
+    padding = [0, -Z % factor, 0, -Y % factor, 0, -X % factor]
+    x = volume if volume.is_floating_point() else volume.to(torch.float32)
+    x = avg_pool3d(pad(x[None, None], padding), factor)[0, 0]
+    if not volume.is_floating_point():
+        x = x.round()
+    return x.to(volume.dtype)
+
 
-# %% ../notebooks/api/00_drr.ipynb 10
+def _ray_length(affine: torch.Tensor, source: torch.Tensor, target: torch.Tensor):
+    """Length of every ray in world units, given the linear part of the voxel-to-world affine."""
+    img = torch.einsum("bij, bnj -> bni", affine.to(target), target - source)
+    return img.norm(dim=-1).unsqueeze(1)
+
+# %% ../notebooks/api/00_drr.ipynb 11
+import functools
+
+from torch.utils.checkpoint import checkpoint
+
+from .detector import RayBundle
 from .pose import RigidTransform, convert
 
 
@@ -144,6 +288,7 @@ def forward(
     convention: str = None,  # If parameterization is Euler angles, specify convention
     calibration: RigidTransform = None,  # Optional calibration matrix with the detector's intrinsic parameters
     mask_to_channels: bool = False,  # If True, structures from the CT mask are rendered in separate channels
+    level: int = 0,  # Level of the volume pyramid to render from (0 is full resolution)
     **kwargs,  # Passed to the renderer
 ):
     """Generate DRR with rotational and translational parameters."""
@@ -153,9 +298,9 @@ def forward(
     else:
         pose = convert(*args, parameterization=parameterization, convention=convention)
 
-    # Create the source / target points and render the image
-    source, target = self.detector(pose, calibration)
-    img = self.render(self.density, source, target, mask_to_channels, **kwargs)
+    # Create the X-rays and render the image
+    rays = self.detector.rays(pose, calibration)
+    img = self.render(self.density, rays, None, mask_to_channels, level=level, **kwargs)
     return self.reshape_transform(img, batch_size=len(pose))
 
 
@@ -163,45 +308,402 @@ def forward(
 def render(
     self: DRR,
     density: torch.tensor,  # Volume from which to render DRRs
-    source: torch.tensor,  # World coordinates of X-ray source
-    target: torch.tensor,  # World coordinates of X-ray target
+    source: (
+        torch.tensor | RayBundle
+    ),  # World coordinates of X-ray source (or a bundle of X-rays)
+    target: (
+        torch.tensor | None
+    ) = None,  # World coordinates of X-ray target (None if source is a bundle of X-rays)
     mask_to_channels: bool = False,  # If True, structures from the CT mask are rendered in separate channels
+    level: int = 0,  # Level of the volume pyramid to render from (0 is full resolution)
     **kwargs,
 ):
-    # Initialize the image with the length of each cast ray
-    img = (target - source).norm(dim=-1).unsqueeze(1)
-
-    # Convert rays to voxelspace
-    source = self.affine_inverse(source)
-    target = self.affine_inverse(target)
+    # The endpoints of the rays are computed for each chunk as it is rendered
+    if isinstance(source, RayBundle):
+        rays = source
+    else:
+        rays = RayBundle(source, target)
+
+    # Optionally, render from a downsampled copy of the volume
+    mask = self.mask if mask_to_channels else None
+    affine_inverse = self.affine_inverse
+    if level > 0:
+        density, mask, affine_inverse = self.pyramid(density, mask, level)
+
+    # Optionally, only render each ray between its first and last occupied bricks of the stored
+    # density (any other density, or one that requires gradients, can be nonzero anywhere)
+    if (
+        self.brick_size is not None
+        and level == 0
+        and density is self.density
+        and not density.requires_grad
+    ):
+        occupancy = self.occupancy()
+    else:
+        occupancy = None
 
     # Render the image
-    kwargs["mask"] = self.mask if mask_to_channels else None
-    if self.patch_size is None:
-        img = self.renderer(
-            density,
-            source,
-            target,
-            img,
-            **kwargs,
-        )
+    if mask_to_channels and self.stack_mask:
+        density = self.stacked(density, mask)
+        kwargs["mask"] = None
     else:
-        n_points = target.shape[1] // self.n_patches
-        partials = []
-        for idx in range(self.n_patches):
-            partial = self.renderer(
-                density,
-                source,
-                target[:, idx * n_points : (idx + 1) * n_points],
-                img[..., idx * n_points : (idx + 1) * n_points],
-                **kwargs,
-            )
-            partials.append(partial)
-        img = torch.cat(partials, dim=-1)
+        kwargs["mask"] = mask
+    if mask_to_channels:
+        kwargs["n_channels"] = self.n_channels
+    B, N = len(rays), rays.n_rays
+    n_poses, n_pixels = self.plan_chunks(
+        density, B, N, dtype=rays.target.dtype, **kwargs
+    )
+    chunks = [
+        (slice(i, i + n_poses), slice(j, j + n_pixels))
+        for i in range(0, B, n_poses)
+        for j in range(0, N, n_pixels)
+    ]
+
+    # Optionally, only store the output of each patch for autograd. The memory budget only covers
+    # rendering a single chunk, so the chunks are always checkpointed when max_memory splits the image.
+    checkpoint_chunks = self.checkpoint_patches or (
+        self.max_memory is not None and len(chunks) > 1
+    )
+    if checkpoint_chunks and torch.is_grad_enabled():
+        renderer = functools.partial(checkpoint, self.renderer, use_reentrant=False)
+    else:
+        renderer = self.renderer
+
+    # The linear part of the affine (scaled by the level of the pyramid) measures the rays in world units
+    affine = self._affine[:, :3, :3].double() * 2**level
+
+    def render_chunk(chunk):
+        # Map the rays from the detector to voxelspace with a single transform
+        source, target = rays.endpoints(*chunk, transform=affine_inverse)
+        source = source.expand(len(target), -1, -1)
+
+        # Initialize the image with the length of each cast ray
+        img = _ray_length(affine, source, target)
+
+        # Dequantize a density stored as uint16 by scaling the length of each ray
+        if density.dtype == torch.uint16:
+            img = img * self._density_scale
+
+        if occupancy is None:
+            bounds = {}
+        else:
+            alphamin, alphamax = self.occupied_bounds(occupancy, source, target)
+            bounds = dict(alphamin=alphamin, alphamax=alphamax)
+        return renderer(density, source, target, img, **{**kwargs, **bounds})
+
+    # Stitch the chunks of pixels of each pose back together
+    partials = self.map_chunks(render_chunk, chunks)
+    n_cols = math.ceil(N / n_pixels)
+    img = torch.cat(
+        [
+            torch.cat(partials[idx : idx + n_cols], dim=-1)
+            for idx in range(0, len(partials), n_cols)
+        ]
+    )
 
     return img
 
-# %% ../notebooks/api/00_drr.ipynb 11
+
+@patch
+def stacked(
+    self: DRR,
+    density: torch.tensor,  # Volume from which to render DRRs
+    mask: torch.tensor,  # Labelmap of the volume
+):
+    """Stack the density and the mask into a volume of shape (2, X, Y, Z)."""
+    n_channels = self.n_channels or _n_channels(density, mask)
+
+    # A density that requires gradients is stacked on every call to keep it in the graph
+    if density.requires_grad:
+        return _stack(density, mask, n_channels)
+
+    # Otherwise, the stacked volume is cached until the density or mask are modified
+    key = (*self._density_key(density), *self._density_key(mask))
+    if self._stacked is None or self._stacked[0] != key:
+        self._stacked = (key, _stack(density, mask, n_channels))
+    return self._stacked[1]
+
+
+def _stack(density, mask, n_channels):
+    """Stack the labels in the dtype of the density, unless it cannot represent every label exactly."""
+    dtype = density.dtype
+    if dtype.is_floating_point and n_channels - 1 > 2 / torch.finfo(dtype).eps:
+        dtype = torch.float32  # e.g., labels above 256 in bfloat16
+    return torch.stack([density.to(dtype), mask.to(dtype)])
+
+
+@patch
+def occupancy(self: DRR):
+    """Get the coarse grid of occupied bricks of the density, rebuilding it if the density was modified."""
+    key = self._density_key(self.density)
+    if self._occupancy_key != key:
+        self._occupancy = _get_occupancy(
+            self.density.detach(),
+            self.brick_size,
+            self.occupancy_threshold,
+            getattr(self, "_density_scale", None),
+        )
+        self._occupancy_key = key
+    return self._occupancy
+
+
+@patch
+def occupied_bounds(
+    self: DRR,
+    occupancy: torch.tensor,  # Coarse grid of occupied bricks
+    source: torch.tensor,  # Voxel coordinates of X-ray source
+    target: torch.tensor,  # Voxel coordinates of X-ray target
+):
+    """Find the first and last intersections of each ray with an occupied brick."""
+    return _get_occupied_bounds(
+        occupancy, source, target, self.brick_size, getattr(self.renderer, "eps", 1e-8)
+    )
+
+
+@patch
+def _density_key(self: DRR, density: torch.tensor):
+    return (density.data_ptr(), density._version)
+
+
+@patch
+def _apply(self: DRR, fn, recurse=True):
+    """Move and cast the buffers like any module, except that half-precision volumes keep their storage dtype."""
+    # Module.to casts every floating-point buffer, so half-precision volumes are viewed as 16-bit
+    # integers (which are only moved) instead of being cast back to full precision
+    compact = {
+        name: buffer.dtype
+        for name, buffer in self._buffers.items()
+        if name in ["density", "mask"]
+        and buffer is not None
+        and buffer.dtype in [torch.float16, torch.bfloat16]
+    }
+    for name in compact:
+        self._buffers[name] = self._buffers[name].view(torch.int16)
+    try:
+        return super(DRR, self)._apply(fn, recurse)
+    finally:
+        for name, dtype in compact.items():
+            self._buffers[name] = self._buffers[name].view(dtype)
+
+
+@patch
+def pyramid(
+    self: DRR,
+    density: torch.tensor,  # Volume from which to render DRRs
+    mask: torch.tensor | None,  # Labelmap of the volume
+    level: int,  # Level of the pyramid (each level halves the resolution)
+):
+    """Get the density, mask, and inverse affine downsampled by a factor of `2**level`."""
+    factor = 2**level
+    affine_inverse = torch.cat(
+        [self._affine_inverse[:, :3] / factor, self._affine_inverse[:, 3:]], dim=1
+    )
+    affine_inverse = RigidTransform(affine_inverse)
+
+    # A density that requires gradients is downsampled on every call to keep it in the graph
+    if density.requires_grad:
+        density = _downsample(density, factor)
+    else:
+        # Otherwise, each level is cached until the density is modified
+        key = self._density_key(density)
+        if level not in self._pyramid or self._pyramid[level][0] != key:
+            self._pyramid[level] = (key, _downsample(density, factor))
+        density = self._pyramid[level][1]
+
+    # The labels of the mask are subsampled instead of averaged
+    if mask is not None:
+        mask = mask[::factor, ::factor, ::factor]
+    return density, mask, affine_inverse
+
+# %% ../notebooks/api/00_drr.ipynb 13
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable
+
+
+@patch
+def plan_chunks(
+    self: DRR,
+    density: torch.tensor,  # Volume from which to render DRRs
+    batch_size: int,  # Number of poses
+    n_pixels: int,  # Number of pixels per pose
+    n_points: int = 500,  # Number of points sampled along each ray by `Trilinear`
+    dtype: torch.dtype = torch.float32,  # Dtype of the rays
+    **kwargs,
+):
+    """Choose how many poses and pixels to render at once."""
+    if self.patch_size is not None:
+        n_poses, chunk_size = batch_size, math.ceil(n_pixels / self.n_patches)
+    elif self.max_memory is None:
+        n_poses, chunk_size = batch_size, n_pixels
+    else:
+        # Estimate the memory needed to render a single ray from the number of samples along it
+        if isinstance(self.renderer, Trilinear):
+            n_samples = n_points
+        else:
+            n_samples = sum(density.shape[-3:]) + 3
+        bytes_per_sample = _bytes_per_sample(self.renderer, density, dtype, **kwargs)
+        n_rays = max(self.max_memory // (bytes_per_sample * n_samples), 1)
+
+        # Chunks rendered in parallel share the memory budget
+        if self.n_workers is not None:
+            n_rays = max(n_rays // self.n_workers, 1)
+
+        # Render as many complete poses as possible, else split the pixels of each pose
+        if n_rays >= n_pixels:
+            n_poses, chunk_size = min(n_rays // n_pixels, batch_size), n_pixels
+        else:
+            n_poses, chunk_size = 1, n_rays
+
+    # Split the pixels further until every worker has a chunk to render
+    if self.n_workers is not None:
+        n_chunks = math.ceil(batch_size / n_poses) * math.ceil(n_pixels / chunk_size)
+        if n_chunks < self.n_workers:
+            chunk_size = math.ceil(chunk_size / math.ceil(self.n_workers / n_chunks))
+    return n_poses, chunk_size
+
+
+@patch
+def map_chunks(
+    self: DRR,
+    fn: Callable,  # Function that renders a chunk
+    chunks: list,  # Chunks of poses and pixels
+):
+    """Render every chunk, in parallel on a pool of threads if `n_workers` is set."""
+    if self.n_workers is None or len(chunks) == 1:
+        return [fn(chunk) for chunk in chunks]
+
+    # Gradient mode is thread-local, so it is propagated to each worker
+    grad_enabled = torch.is_grad_enabled()
+
+    def task(chunk):
+        with torch.set_grad_enabled(grad_enabled):
+            return fn(chunk)
+
+    # Each worker runs its ops with its own number of intra-op threads
+    n_threads = self.n_threads
+    if n_threads is None:
+        n_threads = max(torch.get_num_threads() // self.n_workers, 1)
+    with ThreadPoolExecutor(
+        self.n_workers, initializer=torch.set_num_threads, initargs=(n_threads,)
+    ) as pool:
+        return list(pool.map(task, chunks))
+
+
+# Measured peak memory of the intermediate tensors per sample along a float32 ray, sampling a single channel
+_BYTES_PER_SAMPLE = 48
+
+
+def _bytes_per_sample(renderer, density, dtype, mask=None, **kwargs):
+    """Estimate the peak memory per sample along a ray, scaled by the precision of the rays and the number of channels sampled."""
+    bytes_per_sample = (
+        _BYTES_PER_SAMPLE * torch.empty((), dtype=dtype).element_size() // 4
+    )
+
+    # The mask is sampled along with the density (as a stacked channel or in a second pass)
+    if density.ndim == 4 or mask is not None:
+        bytes_per_sample *= 2
+
+    # Indexing the volume (explicitly, or because its dtype differs from the rays) instead of calling
+    # grid_sample stores the 8 neighbors and weights of each interpolated sample for autograd
+    mode, lookup = getattr(renderer, "mode", "nearest"), getattr(
+        renderer, "lookup", "grid_sample"
+    )
+    if mode == "bilinear" and (lookup == "gather" or density.dtype != dtype):
+        bytes_per_sample *= 8
+    return bytes_per_sample
+
+
+def _parse_memory(max_memory):
+    """Convert a memory budget (e.g., 2e9 or "2GB") to bytes."""
+    if max_memory is None:
+        return None
+    if isinstance(max_memory, (int, float)):
+        return int(max_memory)
+    units = {"B": 1, "KB": 2**10, "MB": 2**20, "GB": 2**30, "TB": 2**40}
+    value = max_memory.strip().upper()
+    for unit in sorted(units, key=len, reverse=True):
+        if value.endswith(unit):
+            return int(float(value[: -len(unit)]) * units[unit])
+    raise ValueError(
+        f"max_memory must be a number of bytes or a string like '2GB', not {max_memory}"
+    )
+
+# %% ../notebooks/api/00_drr.ipynb 16
+import copy
+from concurrent.futures import ProcessPoolExecutor
+
+import torch.multiprocessing as mp
+
+
+@patch
+def farm(
+    self: DRR,
+    *args,  # Some batched representation of SE(3)
+    parameterization: str = None,  # Specifies the representation of the rotation
+    convention: str = None,  # If parameterization is Euler angles, specify convention
+    chunk_size: int = 64,  # Number of poses rendered by a worker at once
+    n_processes: int = 2,  # Number of worker processes
+    n_threads: int = 1,  # Intra-op threads per worker process
+    start_method: str = "spawn",  # Method used to start the worker processes
+    **kwargs,  # Passed to `DRR.forward`
+):
+    """Render chunks of poses on a pool of processes that share the CT, yielding the DRRs of each chunk in order."""
+    if parameterization is None:
+        pose = args[0]
+    else:
+        pose = convert(*args, parameterization=parameterization, convention=convention)
+
+    # Move the buffers to shared memory so the workers are sent handles instead of copies,
+    # and drop the subject (which holds another copy of the CT) from the module sent to them
+    drr = copy.copy(self)
+    drr.subject = None
+    drr._stacked = None
+    drr._pyramid = {}
+    drr._detectors = {}
+    drr.share_memory()
+
+    # Generators cannot be sent to a spawned process, so the workers rebuild the detector's from its state
+    generator = self.detector._generator
+    drr._modules = dict(self._modules)
+    drr.detector = copy.copy(self.detector)
+    drr.detector._generator = None
+    state = None if generator is None else generator.get_state()
+
+    # Stream the chunks back in order as they are rendered
+    chunks = (
+        (pose.matrix[idx : idx + chunk_size], kwargs)
+        for idx in range(0, len(pose), chunk_size)
+    )
+
+    # Unlike multiprocessing.Pool, the executor raises (instead of hanging) if a worker fails to start
+    context = mp.get_context(start_method)
+    with ProcessPoolExecutor(
+        n_processes,
+        mp_context=context,
+        initializer=_init_farm,
+        initargs=(drr, n_threads, state),
+    ) as pool:
+        yield from pool.map(_render_farm, chunks)
+
+
+_farm_drr = None
+
+
+def _init_farm(drr, n_threads, state):
+    global _farm_drr
+    torch.set_num_threads(n_threads)
+    if state is not None:
+        drr.detector._generator = torch.Generator().set_state(state)
+    _farm_drr = drr
+
+
+def _render_farm(chunk):
+    matrix, kwargs = chunk
+    with torch.no_grad():
+        return _farm_drr(RigidTransform(matrix), **kwargs)
+
+# %% ../notebooks/api/00_drr.ipynb 21
 @patch
 def set_intrinsics_(
     self: DRR,
@@ -213,8 +715,8 @@ def set_intrinsics_(
     x0: float = None,
     y0: float = None,
 ):
-    """Set new intrinsic parameters (inplace)."""
-    self.detector = Detector(
+    """Set new intrinsic parameters (inplace), reusing the detector if these intrinsics were set before."""
+    intrinsics = _detector_key(
         sdd if sdd is not None else self.detector.sdd,
         height if height is not None else self.detector.height,
         width if width is not None else self.detector.width,
@@ -222,12 +724,51 @@ def set_intrinsics_(
         dely if dely is not None else self.detector.dely,
         x0 if x0 is not None else self.detector.x0,
         y0 if y0 is not None else self.detector.y0,
-        n_subsample=self.detector.n_subsample,
-        reverse_x_axis=self.detector.reverse_x_axis,
-        reorient=self.subject.reorient,
-    ).to(self.density)
+        self.detector.n_subsample,
+    )
 
-# %% ../notebooks/api/00_drr.ipynb 12
+    # Cache the current detector so switching back to its intrinsics is free
+    current = _detector_key(
+        self.detector.sdd,
+        self.detector.height,
+        self.detector.width,
+        self.detector.delx,
+        self.detector.dely,
+        self.detector.x0,
+        self.detector.y0,
+        self.detector.n_subsample,
+    )
+    self._detectors.setdefault(current, self.detector)
+
+    if intrinsics not in self._detectors:
+        sdd, height, width, delx, dely, x0, y0, n_subsample = intrinsics
+        self._detectors[intrinsics] = Detector(
+            sdd,
+            height,
+            width,
+            delx,
+            dely,
+            x0,
+            y0,
+            n_subsample=n_subsample,
+            reverse_x_axis=self.detector.reverse_x_axis,
+            subsample=self.detector.subsample,
+            resample_every=self.detector.resample_every,
+            subsample_per_pose=self.detector.subsample_per_pose,
+            seed=self.detector.seed,
+            reorient=self.detector._reorient,
+        )
+    self.detector = self._detectors[intrinsics].to(self._affine)
+
+
+def _detector_key(sdd, height, width, delx, dely, x0, y0, n_subsample):
+    """Round the intrinsics to the precision they are stored at in the `Detector`."""
+    sdd, delx, dely, x0, y0 = torch.tensor(
+        [sdd, delx, dely, x0, y0], dtype=torch.float32
+    ).tolist()
+    return sdd, int(height), int(width), delx, dely, x0, y0, n_subsample
+
+# %% ../notebooks/api/00_drr.ipynb 22
 @patch
 def rescale_detector_(self: DRR, scale: float):
     """Rescale the detector plane (inplace)."""
@@ -238,7 +779,7 @@ def rescale_detector_(self: DRR, scale: float):
         dely=float(self.detector.dely / scale),
     )
 
-# %% ../notebooks/api/00_drr.ipynb 13
+# %% ../notebooks/api/00_drr.ipynb 24
 @patch
 def perspective_projection(
     self: DRR,
@@ -255,7 +796,7 @@ def perspective_projection(
         x[..., 1] = self.detector.width - x[..., 1]
     return x[..., :2].flip(-1)
 
-# %% ../notebooks/api/00_drr.ipynb 14
+# %% ../notebooks/api/00_drr.ipynb 25
 from torch.nn.functional import pad
 
 
@@ -276,3 +817,139 @@ def inverse_projection(
     )
     extrinsic = self.detector.reorient.compose(pose)
     return extrinsic(x)
+
+# %% ../notebooks/api/00_drr.ipynb 37
+import warnings
+
+
+class ExportableDRR(nn.Module):
+    """A DRR with fixed geometry that renders a batch of (B, 4, 4) pose matrices using only tensor operations."""
+
+    def __init__(
+        self,
+        drr: DRR,  # DRR module whose volume, detector, and renderer are fixed
+        mask_to_channels: bool = False,  # If True, structures from the CT mask are rendered in separate channels
+        calibration: RigidTransform = None,  # Optional calibration matrix with the detector's intrinsic parameters
+        **kwargs,  # Passed to the renderer
+    ):
+        super().__init__()
+        if drr.detector.n_subsample is not None:
+            raise ValueError("Cannot export a DRR that subsamples pixels")
+        if drr.brick_size is not None:
+            raise ValueError(
+                "Cannot export a DRR with brick_size (the occupancy bounds have dynamic shapes)"
+            )
+        if isinstance(drr.renderer, Siddon) and not drr.renderer.static_shapes:
+            raise ValueError("Exporting a DRR with Siddon requires static_shapes=True")
+
+        # Copy the tensors of the volume and the detector (but not the torchio.Subject)
+        calibration = drr.detector.calibration if calibration is None else calibration
+        self.register_buffer("density", drr.density)
+        self.register_buffer("mask", drr.mask if mask_to_channels else None)
+        self.register_buffer("_density_scale", getattr(drr, "_density_scale", None))
+        self.register_buffer("_affine", drr._affine)
+        self.register_buffer("_affine_inverse", drr._affine_inverse)
+        self.register_buffer("_reorient", drr.detector._reorient)
+        self.register_buffer("_calibration", calibration.matrix)
+        self.register_buffer("source", drr.detector.source)
+        self.register_buffer("target", drr.detector.target)
+        self.renderer = drr.renderer
+        self.height = drr.detector.height
+        self.width = drr.detector.width
+        self.n_channels = drr.n_channels if mask_to_channels else None
+        self.kwargs = kwargs
+
+    def forward(self, pose: torch.Tensor):
+        # Map the rays from the detector to voxelspace with a single transform
+        rays = RayBundle(
+            self.source,
+            self.target,
+            RigidTransform(pose.double() @ self._reorient.double()),
+            RigidTransform(self._calibration),
+        )
+        source, target = rays.endpoints(transform=RigidTransform(self._affine_inverse))
+        source = source.expand(len(target), -1, -1)
+
+        # Initialize the image with the length of each cast ray
+        img = _ray_length(self._affine[:, :3, :3], source, target)
+        if self._density_scale is not None:
+            img = img * self._density_scale
+
+        # Render the image
+        img = self.renderer(
+            self.density,
+            source,
+            target,
+            img,
+            mask=self.mask,
+            n_channels=self.n_channels,
+            **self.kwargs,
+        )
+        return img.view(len(pose), -1, self.height, self.width)
+
+
+@patch
+def export(
+    self: DRR,
+    pose: RigidTransform,  # Example poses (their batch size is fixed in the traced module)
+    mask_to_channels: bool = False,  # If True, structures from the CT mask are rendered in separate channels
+    calibration: RigidTransform = None,  # Optional calibration matrix with the detector's intrinsic parameters
+    **kwargs,  # Passed to the renderer
+) -> torch.jit.ScriptModule:
+    """Trace the DRR into a self-contained TorchScript module that renders a batch of (B, 4, 4) pose matrices."""
+    module = ExportableDRR(self, mask_to_channels, calibration, **kwargs)
+
+    # The tracer warns that batch sizes are recorded as constants, which is intended here
+    with torch.no_grad(), warnings.catch_warnings():
+        warnings.simplefilter("ignore", torch.jit.TracerWarning)
+        return torch.jit.trace(module, pose.matrix)
+
+# %% ../notebooks/api/00_drr.ipynb 41
+@patch
+def system_matrix(
+    self: DRR,
+    pose: RigidTransform,  # Fixed poses of the C-arm
+    calibration: RigidTransform = None,  # Optional calibration matrix with the detector's intrinsic parameters
+) -> SystemMatrix:
+    """Precompute the Siddon system matrix of a fixed set of poses, such that rendering is a sparse matrix-vector product."""
+    if self.detector.n_subsample is not None:
+        raise ValueError(
+            "Cannot precompute the system matrix of a detector that subsamples pixels"
+        )
+
+    # Trace the rays in chunks (within the memory budget of the DRR), keeping only their intersections
+    rays = self.detector.rays(pose, calibration)
+    B, N = len(rays), rays.n_rays
+    n_poses, n_pixels = self.plan_chunks(self.density, B, N, dtype=rays.target.dtype)
+    affine = self._affine[:, :3, :3].double()
+    eps = getattr(self.renderer, "eps", 1e-8)
+    rows, cols, values = [], [], []
+    with torch.no_grad():
+        for i in range(0, B, n_poses):
+            for j in range(0, N, n_pixels):
+                chunk = (slice(i, i + n_poses), slice(j, j + n_pixels))
+                source, target = rays.endpoints(*chunk, transform=self.affine_inverse)
+                source = source.expand(len(target), -1, -1)
+                img = _ray_length(affine, source, target)
+
+                # Dequantize a density stored as uint16 by scaling the length of each ray
+                if self.density.dtype == torch.uint16:
+                    img = img * self._density_scale
+                b, n, voxels, lengths = _siddon_system_matrix(
+                    self.density.shape, source, target, img, eps
+                )
+                rows.append((b + i) * N + n + j)
+                cols.append(voxels)
+                values.append(lengths)
+
+    shape = (
+        (B, 1, self.detector.height, self.detector.width) if self.reshape else (B, 1, N)
+    )
+    return SystemMatrix(
+        torch.cat(rows),
+        torch.cat(cols),
+        torch.cat(values),
+        B * N,
+        self.density.shape,
+        shape,
+    )
@@ -4,12 +4,13 @@
 from __future__ import annotations
 
 import torch
+from .drr import SparseDRR
 
 # %% auto 0
 __all__ = ['NormalizedCrossCorrelation2d', 'MultiscaleNormalizedCrossCorrelation2d', 'GradientNormalizedCrossCorrelation2d',
            'MutualInformation', 'LogGeodesicSE3', 'DoubleGeodesicSE3']
 
-# %% ../notebooks/api/05_metrics.ipynb 6
+# %% ../notebooks/api/05_metrics.ipynb 7
 from einops import rearrange
 
 
@@ -17,7 +18,25 @@ def to_patches(x, patch_size):
     x = x.unfold(2, patch_size, step=1).unfold(3, patch_size, step=1).contiguous()
     return rearrange(x, "b c p1 p2 h w -> b (c p1 p2) h w")
 
-# %% ../notebooks/api/05_metrics.ipynb 7
+
+def is_sparse(*xs):
+    return any(isinstance(x, SparseDRR) for x in xs)
+
+
+def sparse_to_images(x1, x2):
+    """Compare sparse DRRs at their rendered pixels, as images of shape (B, C, n, 1)."""
+    if is_sparse(x1, x2) and not is_sparse(x1):
+        x2, x1 = sparse_to_images(x2, x1)
+        return x1, x2
+    if is_sparse(x2):
+        if not torch.equal(x1.indices, x2.indices):
+            raise ValueError("Sparse DRRs must be rendered at the same pixels")
+        x2 = x2.values
+    else:
+        x2 = x1.gather(x2)
+    return x1.values.unsqueeze(-1), x2.unsqueeze(-1)
+
+# %% ../notebooks/api/05_metrics.ipynb 8
 class NormalizedCrossCorrelation2d(torch.nn.Module):
     """Compute Normalized Cross Correlation between two batches of images."""
 
@@ -27,6 +46,10 @@ class NormalizedCrossCorrelation2d(torch.nn.Module):
         self.eps = eps
 
     def forward(self, x1, x2):
+        if is_sparse(x1, x2):
+            if self.patch_size is not None:
+                raise ValueError("Patchwise NCC is not supported for sparse DRRs")
+            x1, x2 = sparse_to_images(x1, x2)
         if self.patch_size is not None:
             x1 = to_patches(x1, self.patch_size)
             x2 = to_patches(x2, self.patch_size)
@@ -43,7 +66,7 @@ class NormalizedCrossCorrelation2d(torch.nn.Module):
         std = var.sqrt()
         return (x - mu) / std
 
-# %% ../notebooks/api/05_metrics.ipynb 8
+# %% ../notebooks/api/05_metrics.ipynb 9
 class MultiscaleNormalizedCrossCorrelation2d(torch.nn.Module):
     """Compute Normalized Cross Correlation between two batches of images at multiple scales."""
 
@@ -62,7 +85,7 @@ class MultiscaleNormalizedCrossCorrelation2d(torch.nn.Module):
             scores.append(weight * ncc(x1, x2))
         return torch.stack(scores, dim=0).sum(dim=0)
 
-# %% ../notebooks/api/05_metrics.ipynb 9
+# %% ../notebooks/api/05_metrics.ipynb 10
 from torchvision.transforms.functional import gaussian_blur
 
 
@@ -89,7 +112,7 @@ class Sobel(torch.nn.Module):
         x = self.filter(img)
         return x
 
-# %% ../notebooks/api/05_metrics.ipynb 10
+# %% ../notebooks/api/05_metrics.ipynb 11
 class GradientNormalizedCrossCorrelation2d(NormalizedCrossCorrelation2d):
     """Compute Normalized Cross Correlation between the image gradients of two batches of images."""
 
@@ -98,9 +121,11 @@ class GradientNormalizedCrossCorrelation2d(NormalizedCrossCorrelation2d):
         self.sobel = Sobel(sigma)
 
     def forward(self, x1, x2):
+        if is_sparse(x1, x2):
+            raise ValueError("Image gradients are not supported for sparse DRRs")
         return super().forward(self.sobel(x1), self.sobel(x2))
 
-# %% ../notebooks/api/05_metrics.ipynb 11
+# %% ../notebooks/api/05_metrics.ipynb 12
 from kornia.enhance.histogram import marginal_pdf, joint_pdf
 
 
@@ -115,6 +140,8 @@ class MutualInformation(torch.nn.Module):
         self.normalize = normalize
 
     def forward(self, x1, x2):
+        if is_sparse(x1, x2):
+            x1, x2 = sparse_to_images(x1, x2)
         assert x1.shape == x2.shape
         B, C, H, W = x1.shape
 
@@ -135,7 +162,7 @@ class MutualInformation(torch.nn.Module):
 
         return mutual_information
 
-# %% ../notebooks/api/05_metrics.ipynb 15
+# %% ../notebooks/api/05_metrics.ipynb 16
 from .pose import RigidTransform, convert
 
 
@@ -154,7 +181,7 @@ class LogGeodesicSE3(torch.nn.Module):
     ) -> Float[torch.Tensor, "b"]:
         return pose_2.compose(pose_1.inverse()).get_se3_log().norm(dim=1)
 
-# %% ../notebooks/api/05_metrics.ipynb 18
+# %% ../notebooks/api/05_metrics.ipynb 19
 from .pose import so3_log_map
 
 
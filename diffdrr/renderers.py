@@ -1,13 +1,53 @@
 # AUTOGENERATED! DO NOT EDIT! File to edit: ../notebooks/api/01_renderers.ipynb.
 
 # %% auto 0
-__all__ = ['Siddon', 'Trilinear']
+__all__ = ['register_renderer', 'get_renderer', 'Siddon', 'Trilinear', 'check_renderer', 'benchmark_renderer', 'SystemMatrix']
 
 # %% ../notebooks/api/01_renderers.ipynb 3
+import functools
+import math
+
 import torch
 from torch.nn.functional import grid_sample
 
-# %% ../notebooks/api/01_renderers.ipynb 7
+# %% ../notebooks/api/01_renderers.ipynb 10
+_RENDERERS = {}
+
+
+def register_renderer(name: str):
+    """Register a renderer class under a name that can be passed to `DRR(renderer=name)`."""
+
+    def decorator(cls):
+        _RENDERERS[name] = cls
+        return cls
+
+    return decorator
+
+
+def get_renderer(name: str, **kwargs):
+    """Initialize a registered renderer (or one advertised under the `diffdrr.renderers` entry point group)."""
+    if name not in _RENDERERS:
+        _load_entry_point(name)
+    if name not in _RENDERERS:
+        raise ValueError(f"renderer must be one of {sorted(_RENDERERS)}, not {name}")
+    return _RENDERERS[name](**kwargs)
+
+
+def _load_entry_point(name):
+    from importlib.metadata import entry_points
+
+    groups = entry_points()
+    if hasattr(groups, "select"):
+        group = groups.select(group="diffdrr.renderers")
+    else:
+        group = groups.get("diffdrr.renderers", [])  # Python < 3.10
+    for entry_point in group:
+        if entry_point.name == name:
+            # Loading the entry point may already register the renderer with the decorator
+            _RENDERERS.setdefault(name, entry_point.load())
+
+# %% ../notebooks/api/01_renderers.ipynb 11
+@register_renderer("siddon")
 class Siddon(torch.nn.Module):
     """Differentiable X-ray renderer implemented with Siddon's method for exact raytracing."""
 
@@ -18,6 +58,12 @@ class Siddon(torch.nn.Module):
         filter_intersections_outside_volume: bool = True,  # Use alphamin/max to filter the intersections
         reducefn: str = "sum",  # Function for combining samples along each ray
         eps: float = 1e-8,  # Small constant to avoid div by zero errors
+        traversal: str = "sort",  # Compute intersections by sorting ("sort") or merging ("merge") all planes, or walking each ray ("dda")
+        packed: bool = False,  # Pack the intersections inside the volume of each ray into a flat array
+        recompute_backward: bool = False,  # Only save the inputs for autograd and recompute the rays in the backward pass
+        recompute_chunk_size: int = 16384,  # Number of rays traced at once with recompute_backward
+        lookup: str = "grid_sample",  # Sample voxels with "grid_sample" or by directly indexing the volume ("gather")
+        static_shapes: bool = False,  # Clamp (instead of remove) intersections outside the volume, such that shapes never depend on the data (e.g., for torch.compile)
     ):
         super().__init__()
         self.mode = mode
@@ -25,9 +71,27 @@ class Siddon(torch.nn.Module):
         self.filter_intersections_outside_volume = filter_intersections_outside_volume
         self.reducefn = reducefn
         self.eps = eps
+        if traversal not in ["sort", "merge", "dda"]:
+            raise ValueError(
+                f"traversal must be 'sort', 'merge', or 'dda', not {traversal}"
+            )
+        self.traversal = traversal
+        if packed and isinstance(reducefn, Callable):
+            raise ValueError(
+                "packed intersections only support reducefn 'sum' or 'max'"
+            )
+        self.packed = packed
+        if static_shapes and (packed or traversal == "dda"):
+            raise ValueError(
+                "static_shapes is not supported with packed intersections or traversal 'dda'"
+            )
+        self.static_shapes = static_shapes
+        self.recompute_backward = recompute_backward
+        self.recompute_chunk_size = recompute_chunk_size
+        self.lookup = _check_lookup(lookup)
 
     def dims(self, volume):
-        return torch.tensor(volume.shape).to(volume)
+        return _constant(tuple(volume.shape[-3:]), volume.device)
 
     def forward(
         self,
@@ -37,65 +101,127 @@ class Siddon(torch.nn.Module):
         img,
         align_corners=False,
         mask=None,
+        alphamin=None,
+        alphamax=None,
+        n_channels=None,
     ):
-        dims = self.dims(volume)
+        bounds = None if alphamin is None or alphamax is None else (alphamin, alphamax)
+        args = (volume, source, target, img, align_corners, mask, bounds, n_channels)
+        if self.recompute_backward and torch.is_grad_enabled():
+            return _RecomputeSiddon.apply(self, *args)
+        return self._raytrace(*args)
+
+    def _raytrace(
+        self,
+        volume,
+        source,
+        target,
+        img,
+        align_corners,
+        mask,
+        bounds=None,
+        n_channels=None,
+    ):
+        dims = self.dims(volume).to(source)
+        shape = volume.shape[-3:]
 
         # Calculate the intersections of each ray with the planes comprising the CT volume
-        alphas = _get_alphas(
-            source,
-            target,
-            dims,
-            self.eps,
-            self.filter_intersections_outside_volume,
-        )
+        if self.traversal in ["sort", "merge"]:
+            alphas = _get_alphas(
+                source,
+                target,
+                dims,
+                self.eps,
+                self.filter_intersections_outside_volume or self.packed,
+                merge=self.traversal == "merge",
+                bounds=bounds,
+                shape=shape,
+                static_shapes=self.static_shapes,
+            )
+        else:
+            alphas = _get_alphas_dda(source, target, dims, self.eps)
+            if bounds is not None:
+                alphas = _filter_intersections_outside_volume(
+                    alphas, source, target, dims, self.eps, bounds, static_shapes=True
+                )
 
-        # Calculate the midpoint of every pair of adjacent intersections
-        # These midpoints lie exclusively in a single voxel
-        alphamid = (alphas[..., 0:-1] + alphas[..., 1:]) / 2
+        if self.packed:
+            # Keep only the non-empty segments of each ray (instead of padding every ray to
+            # the longest one), packing their midpoints and lengths into flat arrays
+            B, _, N = img.shape
+            xyzs, intersection_length, img, rays = _pack(
+                alphas,
+                source,
+                target,
+                img,
+                dims,
+                self.eps,
+                self.lookup == "grid_sample",
+            )
+        else:
+            # Calculate the midpoint of every pair of adjacent intersections
+            # These midpoints lie exclusively in a single voxel
+            alphamid = (alphas[..., 0:-1] + alphas[..., 1:]) / 2
 
-        # Get the XYZ coordinate of each midpoint (normalized to [-1, +1]^3)
-        xyzs = _get_xyzs(alphamid, source, target, dims, self.eps)
+            # Get the XYZ coordinate of each midpoint (normalized to [-1, +1]^3 for grid_sample)
+            xyzs = _get_xyzs(
+                alphamid, source, target, dims, self.eps, self.lookup == "grid_sample"
+            )
+            intersection_length = torch.diff(alphas, dim=-1)
 
-        # Use torch.nn.functional.grid_sample to lookup the values of each intersected voxel
+        # Lookup the values of each intersected voxel (and optionally, its label in the mask)
         if self.stop_gradients_through_grid_sample:
             with torch.no_grad():
-                img = _get_voxel(
-                    volume, xyzs, img, self.mode, align_corners=align_corners
+                img, channels = _get_voxel_and_channel(
+                    volume, mask, xyzs, img, self.mode, align_corners, self.lookup
                 )
         else:
-            img = _get_voxel(volume, xyzs, img, self.mode, align_corners=align_corners)
+            img, channels = _get_voxel_and_channel(
+                volume, mask, xyzs, img, self.mode, align_corners, self.lookup
+            )
 
         # Weight each intersected voxel by the length of the ray's intersection with the voxel
-        intersection_length = torch.diff(alphas, dim=-1)
         img = img * intersection_length
 
         # Handle optional masking
-        if mask is None:
+        if self.packed:
+            if channels is None:
+                img = reduce_packed(img, rays, (B, 1, N), self.reducefn)
+            else:
+                C = n_channels or _n_channels(volume, mask)
+                img = reduce_packed(img, rays, (B, C, N), "sum", channels)
+        elif channels is None:
             img = reduce(img, self.reducefn)
             img = img.unsqueeze(1)
         else:
             # Thanks to @Ivan for the clutch assist w/ pytorch tensor ops
             # https://stackoverflow.com/questions/78323859/broadcast-pytorch-array-across-channels-based-on-another-array/78324614#78324614
             B, D, _ = img.shape
-            C = int(mask.max().item() + 1)
-            channels = _get_voxel(
-                mask, xyzs, img=None, mode=self.mode, align_corners=align_corners
-            ).long()
-            img = (
-                torch.zeros(B, C, D)
-                .to(img)
-                .scatter_add_(1, channels.transpose(-1, -2), img.transpose(-1, -2))
+            C = n_channels or _n_channels(volume, mask)
+            img = img.new_zeros(B, C, D).scatter_add_(
+                1, channels.transpose(-1, -2), img.transpose(-1, -2)
             )
 
         return img
 
-# %% ../notebooks/api/01_renderers.ipynb 8
-def _get_alphas(source, target, dims, eps, filter_intersections_outside_volume):
+# %% ../notebooks/api/01_renderers.ipynb 12
+def _get_alphas(
+    source,
+    target,
+    dims,
+    eps,
+    filter_intersections_outside_volume,
+    merge=False,
+    bounds=None,
+    shape=None,
+    static_shapes=False,
+):
     """Calculates the parametric intersections of each ray with the planes of the CT volume."""
     # Parameterize the parallel XYZ planes that comprise the CT volumes
-    alphax = torch.arange(dims[0] + 1).to(source)
-    alphay = torch.arange(dims[1] + 1).to(source)
-    alphaz = torch.arange(dims[2] + 1).to(source)
+    X, Y, Z = dims.tolist() if shape is None else shape
+    alphax = _arange(X + 1, source.device).to(source)
+    alphay = _arange(Y + 1, source.device).to(source)
+    alphaz = _arange(Z + 1, source.device).to(source)
 
     # Calculate the parametric intersection of each ray with every plane
     sx, sy, sz = source[..., 0:1], source[..., 1:2], source[..., 2:3]
@@ -103,28 +229,46 @@ def _get_alphas(source, target, dims, eps, filter_intersections_outside_volume):
     alphax = (alphax.expand(len(source), 1, -1) - sx) / (tx - sx + eps)
     alphay = (alphay.expand(len(source), 1, -1) - sy) / (ty - sy + eps)
     alphaz = (alphaz.expand(len(source), 1, -1) - sz) / (tz - sz + eps)
-    alphas = torch.cat([alphax, alphay, alphaz], dim=-1)
 
     # Sort the intersections
-    alphas = torch.sort(alphas, dim=-1).values
+    if merge:
+        alphas = _merge_alphas(alphax, alphay, alphaz, target - source + eps)
+    else:
+        alphas = torch.cat([alphax, alphay, alphaz], dim=-1)
+        alphas = torch.sort(alphas, dim=-1).values
     if filter_intersections_outside_volume:
-        alphas = _filter_intersections_outside_volume(alphas, source, target, dims, eps)
+        alphas = _filter_intersections_outside_volume(
+            alphas, source, target, dims, eps, bounds, static_shapes
+        )
     return alphas
 
 
-def _filter_intersections_outside_volume(alphas, source, target, dims, eps):
-    """Remove interesections that are outside of the volume for all rays."""
-    alphamin, alphamax = _get_alpha_minmax(source, target, dims, eps)
-    good_idxs = torch.logical_and(alphamin <= alphas, alphas <= alphamax)
-    alphas = alphas[..., good_idxs.any(dim=[0, 1])]
-    return alphas
+def _filter_intersections_outside_volume(
+    alphas, source, target, dims, eps, bounds=None, static_shapes=False
+):
+    """Restrict the intersections of each ray to its first and last intersections with the volume (or the given bounds)."""
+    if bounds is None:
+        alphamin, alphamax = _get_alpha_minmax(source, target, dims, eps)
+    else:
+        alphamin, alphamax = bounds
+
+    # Remove the interesections that are outside of the volume for all rays
+    if not static_shapes:
+        good_idxs = torch.logical_and(alphamin <= alphas, alphas <= alphamax)
+        alphas = alphas[..., good_idxs.any(dim=[0, 1])]
+
+    # The remaining intersections can still be outside the bounds of a single ray (e.g., past a
+    # target inside the volume), so clamp them to the entry and exit of each ray (which are added
+    # as intersections themselves), such that they become segments of zero length
+    alphas = torch.cat([alphamin, alphas, alphamax], dim=-1)
+    return torch.minimum(torch.maximum(alphas, alphamin), alphamax)
 
 
 def _get_alpha_minmax(source, target, dims, eps):
     """Calculate the first and last intersections of each ray with the volume."""
     sdd = target - source + eps
 
-    alpha0 = (torch.zeros(3).to(source) - source) / sdd
+    alpha0 = -source / sdd
     alpha1 = ((dims + 1).to(source) - source) / sdd
     alphas = torch.stack([alpha0, alpha1])
 
@@ -136,7 +280,7 @@ def _get_alpha_minmax(source, target, dims, eps):
     return alphamin, alphamax
 
 
-def _get_xyzs(alpha, source, target, dims, eps):
+def _get_xyzs(alpha, source, target, dims, eps, normalize=True):
     """Given a set of rays and parametric coordinates, calculates the XYZ coordinates."""
     # Get the world coordinates of every point parameterized by alpha
     xyzs = (
@@ -145,26 +289,373 @@ def _get_xyzs(alpha, source, target, dims, eps):
     ).unsqueeze(1)
 
     # Normalize coordinates to be in [-1, +1] for grid_sample
-    xyzs = 2 * xyzs / dims - 1
+    if normalize:
+        xyzs = 2 * xyzs / dims - 1
     return xyzs
 
 
-def _get_voxel(volume, xyzs, img, mode, align_corners):
-    """Wraps torch.nn.functional.grid_sample to sample a volume at XYZ coordinates."""
-    batch_size = len(xyzs)
-    voxels = grid_sample(
-        input=volume.permute(2, 1, 0)[None, None].expand(batch_size, -1, -1, -1, -1),
-        grid=xyzs,
-        mode=mode,
-        align_corners=align_corners,
-    )[:, 0, 0]
+def _get_voxel(volume, xyzs, img, mode, align_corners, lookup="grid_sample"):
+    """Sample a volume at XYZ coordinates with torch.nn.functional.grid_sample or by indexing."""
+    voxels = _sample(volume[None], xyzs, mode, align_corners, lookup)[:, 0]
     if img is not None:
-        img = torch.einsum("bcn, bnj -> bnj", img, voxels)
+        img = img.transpose(-1, -2) * voxels
     else:
         img = voxels
     return img
 
-# %% ../notebooks/api/01_renderers.ipynb 9
+
+def _get_voxel_and_channel(volume, mask, xyzs, img, mode, align_corners, lookup):
+    """Sample the density and (optionally) the label of the mask at XYZ coordinates."""
+    if volume.ndim == 4:
+        # The density and the mask are stacked as channels, so both are sampled in a single pass
+        voxels = _sample(volume, xyzs, mode, align_corners, lookup)
+        img = img.transpose(-1, -2) * voxels[:, 0]
+        return img, voxels[:, 1].long()
+    img = _get_voxel(volume, xyzs, img, mode, align_corners, lookup)
+    if mask is None:
+        return img, None
+    channels = _get_voxel(mask, xyzs, None, mode, align_corners, lookup).long()
+    return img, channels
+
+
+def _sample(volume, xyzs, mode, align_corners, lookup):
+    """Sample every channel of a (C, X, Y, Z) volume, returning a tensor of shape (B, C, n_rays, n_points)."""
+    if lookup == "grid_sample" and volume.dtype == xyzs.dtype:
+        batch_size = len(xyzs)
+        voxels = grid_sample(
+            input=volume.permute(0, 3, 2, 1)[None].expand(batch_size, -1, -1, -1, -1),
+            grid=xyzs,
+            mode=mode,
+            align_corners=align_corners,
+        )[:, :, 0]
+    else:
+        # Compact volumes (e.g., half precision or integer labels) are indexed directly, such
+        # that only the sampled voxels are dequantized instead of the whole volume
+        if lookup == "grid_sample":
+            dims = _constant(tuple(volume.shape[-3:]), xyzs.device)
+            xyzs = (xyzs + 1) * dims / 2
+        voxels = _gather(volume, xyzs[:, 0], mode, align_corners).transpose(0, 1)
+    return voxels
+
+
+def _n_channels(volume, mask):
+    """Count the structures in the mask (stored in the second channel of a stacked volume)."""
+    labels = mask if volume.ndim == 3 else volume[1]
+    if labels.dtype == torch.uint16:
+        labels = labels.to(torch.int32)  # Reductions are not implemented for uint16
+    return int(labels.max().item() + 1)
+
+
+def _cache_constant(fn):
+    """Cache a function returning a constant tensor in eager mode (torch.compile traces it into the graph)."""
+    cached = functools.lru_cache(fn)
+
+    @functools.wraps(fn)
+    def wrapper(*args):
+        if torch.compiler.is_compiling():
+            return fn(*args)
+        return cached(*args)
+
+    return wrapper
+
+
+@_cache_constant
+def _constant(values: tuple, device: torch.device):
+    """A small constant tensor (e.g., the shape of a volume), only copied to each device once."""
+    # Cached tensors are reused outside of inference mode, so they cannot be inference tensors
+    with torch.inference_mode(False):
+        return torch.tensor(values, device=device)
+
+
+@_cache_constant
+def _arange(n: int, device: torch.device):
+    with torch.inference_mode(False):
+        return torch.arange(n, device=device)
+
+# %% ../notebooks/api/01_renderers.ipynb 13
+from itertools import product
+
+
+def _gather(volume, xyzs, mode, align_corners):
+    """Sample a (C, X, Y, Z) volume at (unnormalized) XYZ coordinates by directly indexing its voxels."""
+    # Voxels are indexed in the flattened volume, with 32-bit indices if possible
+    C, X, Y, Z = volume.shape
+    dtype = torch.int32 if X * Y * Z < 2**31 else torch.int64
+
+    # Index the volume at the nearest voxel or interpolate the 8 neighboring voxels, accumulating
+    # the flat index one axis at a time. Neighbors outside of the volume are given zero weight.
+    if mode == "nearest":
+        idxs, inside = [], []
+        for xyz, dim, stride in _axes(xyzs, (X, Y, Z), align_corners):
+            idx = xyz.round_().to(dtype)
+            inside.append((0 <= idx) & (idx < dim))
+            idxs.append(idx.clamp_(0, dim - 1) * stride)
+        voxels = _take(volume, idxs[0] + idxs[1] + idxs[2], xyzs.dtype)
+        return voxels.masked_fill_(~(inside[0] & inside[1] & inside[2]), 0.0)
+    elif mode == "bilinear":
+        corners = []
+        for xyz, dim, stride in _axes(xyzs, (X, Y, Z), align_corners):
+            idx = xyz.floor()
+            weight = xyz - idx
+            idx = idx.to(dtype)
+            inside0 = (0 <= idx) & (idx < dim)
+            inside1 = (-1 <= idx) & (idx < dim - 1)
+            corners.append(
+                [
+                    (
+                        idx.clamp(0, dim - 1) * stride,
+                        torch.where(inside0, 1 - weight, 0.0),
+                    ),
+                    (
+                        (idx + 1).clamp_(0, dim - 1) * stride,
+                        torch.where(inside1, weight, 0.0),
+                    ),
+                ]
+            )
+        voxels = 0.0
+        for (x, wx), (y, wy), (z, wz) in product(*corners):
+            voxels = voxels + wx * wy * wz * _take(volume, x + y + z, xyzs.dtype)
+        return voxels
+    else:
+        raise ValueError(
+            f"lookup='gather' only supports mode 'nearest' or 'bilinear', not {mode}"
+        )
+
+
+def _axes(xyzs, dims, align_corners):
+    """Convert XYZ coordinates to continuous voxel indices along each axis (same convention as grid_sample)."""
+    X, Y, Z = dims
+    for xyz, dim, stride in zip(xyzs.unbind(-1), dims, (Y * Z, Z, 1)):
+        xyz = xyz * (dim - 1) / dim if align_corners else xyz - 0.5
+        yield xyz, dim, stride
+
+
+def _take(volume, idxs, dtype):
+    """Index a (C, X, Y, Z) volume with flat voxel indices."""
+    voxels = volume.flatten(1).index_select(1, idxs.flatten()).view(-1, *idxs.shape)
+    return voxels.to(dtype)  # Dequantize compact volumes after indexing
+
+
+def _check_lookup(lookup):
+    if lookup not in ["grid_sample", "gather"]:
+        raise ValueError(f"lookup must be 'grid_sample' or 'gather', not {lookup}")
+    return lookup
+
+# %% ../notebooks/api/01_renderers.ipynb 14
+def _merge_alphas(alphax, alphay, alphaz, sdd):
+    """Merge the (already monotone) intersections with the X, Y, and Z planes into a single sorted array."""
+    # The intersections along each axis are decreasing if the ray points in the negative direction
+    alphax = torch.where(sdd[..., 0:1] > 0, alphax, alphax.flip(-1)).contiguous()
+    alphay = torch.where(sdd[..., 1:2] > 0, alphay, alphay.flip(-1)).contiguous()
+    alphaz = torch.where(sdd[..., 2:3] > 0, alphaz, alphaz.flip(-1)).contiguous()
+
+    # The position of every intersection in the merged array is its position in its own
+    # array plus the number of intersections preceding it in the other two arrays
+    # (ties are broken in the order X, Y, Z to make the positions a permutation)
+    xy, yx = _corank(alphax, alphay)
+    xz, zx = _corank(alphax, alphaz)
+    yz, zy = _corank(alphay, alphaz)
+    posx = torch.arange(alphax.shape[-1], device=xy.device) + xy + xz
+    posy = torch.arange(alphay.shape[-1], device=yx.device) + yx + yz
+    posz = torch.arange(alphaz.shape[-1], device=zx.device) + zx + zy
+
+    # Scatter the intersections into their merged positions
+    idxs = torch.cat([posx, posy, posz], dim=-1)
+    alphas = torch.cat([alphax, alphay, alphaz], dim=-1)
+    return torch.zeros_like(alphas).scatter(-1, idxs, alphas)
+
+
+def _corank(a, b):
+    """For sorted arrays a and b, count the elements of b < a[i] and the elements of a <= b[j]."""
+    rank_a = torch.searchsorted(b, a)
+    ones = torch.ones_like(rank_a)
+    rank_b = torch.zeros(
+        *b.shape[:-1], b.shape[-1] + 1, dtype=ones.dtype, device=ones.device
+    )
+    rank_b = rank_b.scatter_add_(-1, rank_a, ones).cumsum(dim=-1)[..., :-1]
+    return rank_a, rank_b
+
+# %% ../notebooks/api/01_renderers.ipynb 15
+from torch.nn.functional import pad
+
+
+def _get_alphas_dda(source, target, dims, eps):
+    """Walk each ray voxel-by-voxel (3D-DDA) to find its intersections with the planes inside the CT volume."""
+    sdd = target - source + eps
+    source = source.expand_as(target)
+
+    # Each intersection is recorded as an (axis, plane) pair and converted to alpha at the end,
+    # such that gradients flow through the source and target. Axis 3 is a sentinel for rays
+    # that start or end inside the volume, in which case alpha is equal to the plane.
+    with torch.no_grad():
+        s, d = source.detach(), sdd.detach()
+
+        # Find the planes where each ray enters and exits the volume
+        alpha0 = (0 - s) / d
+        alpha1 = (dims - s) / d
+        alphamin, entry_axis = torch.minimum(alpha0, alpha1).max(dim=-1, keepdim=True)
+        alphamax, exit_axis = torch.maximum(alpha0, alpha1).min(dim=-1, keepdim=True)
+        entry_plane = torch.where(d > 0, 0, dims).gather(-1, entry_axis)
+        exit_plane = torch.where(d > 0, dims, 0).gather(-1, exit_axis)
+
+        # Handle rays whose source or target is inside the volume
+        entry_axis = torch.where(alphamin < 0.0, 3, entry_axis)
+        entry_plane = torch.where(alphamin < 0.0, 0.0, entry_plane)
+        alphamin = alphamin.clamp(min=0.0)
+        exit_axis = torch.where(alphamax > 1.0, 3, exit_axis)
+        exit_plane = torch.where(alphamax > 1.0, 1.0, exit_plane)
+        alphamax = alphamax.clamp(max=1.0)
+
+        # Rays that miss the volume exit where they enter, yielding zero-length segments
+        miss = alphamin > alphamax
+        exit_axis = torch.where(miss, entry_axis, exit_axis)
+        exit_plane = torch.where(miss, entry_plane, exit_plane)
+        alphamax = torch.where(miss, alphamin, alphamax)
+
+        # Initialize the next plane crossed along each axis after entering the volume
+        step = torch.where(d > 0, 1.0, -1.0).to(d)
+        entry = s + alphamin * d
+        plane = torch.where(d > 0, entry.floor() + 1, entry.ceil() - 1)
+        tmax = (plane - s) / d
+
+        # Upper bound on the number of planes crossed by any ray
+        n_steps = (d.abs() * (alphamax - alphamin)).ceil().sum(dim=-1).max()
+        n_steps = int(n_steps.item()) + 3
+
+        # Step through the volume, always crossing the nearest plane next
+        axes = [entry_axis]
+        planes = [entry_plane]
+        for _ in range(n_steps):
+            alpha, axis = tmax.min(dim=-1, keepdim=True)
+            done = alpha > alphamax
+            axes.append(torch.where(done, exit_axis, axis))
+            planes.append(torch.where(done, exit_plane, plane.gather(-1, axis)))
+            plane = plane.scatter_add(-1, axis, step.gather(-1, axis))
+            tmax = tmax.scatter(
+                -1,
+                axis,
+                (plane.gather(-1, axis) - s.gather(-1, axis)) / d.gather(-1, axis),
+            )
+        axes = torch.cat(axes, dim=-1)
+        planes = torch.cat(planes, dim=-1)
+
+    # Convert the planes to parametric intersections (differentiable w.r.t. source and target)
+    source = pad(source, (0, 1), value=0.0).gather(-1, axes)
+    sdd = pad(sdd, (0, 1), value=1.0).gather(-1, axes)
+    alphas = (planes - source) / sdd
+    return alphas
+
+# %% ../notebooks/api/01_renderers.ipynb 16
+def _pack(alphas, source, target, img, dims, eps, normalize=True):
+    """Pack the non-empty segments of every ray into a single flat array of shape (1, 1, n_segments, 1, 3)."""
+    # Intersections outside the bounds of each ray have been clamped to them, yielding empty segments
+    alphas = alphas.flatten(0, 1)
+    rays, idxs = (alphas[:, :-1] < alphas[:, 1:]).nonzero(as_tuple=True)
+
+    # The segments are sorted by ray, so the segments of each ray are stored contiguously
+    idxs = rays * alphas.shape[-1] + idxs
+    alpha0 = alphas.flatten().take(idxs)
+    alpha1 = alphas.flatten().take(idxs + 1)
+
+    # Get the XYZ coordinate of the midpoint of every segment from the origin and direction of its ray
+    sdd = (target - source + eps).flatten(0, 1).index_select(0, rays)
+    source = source.expand_as(target).flatten(0, 1).index_select(0, rays)
+    xyzs = source + ((alpha0 + alpha1) / 2).unsqueeze(-1) * sdd
+    if normalize:
+        xyzs = 2 * xyzs / dims - 1
+    img = img.transpose(-1, -2).flatten(0, 1).index_select(0, rays)
+    lengths = alpha1 - alpha0
+    return xyzs[None, None, :, None], lengths[None, :, None], img.T[None], rays
+
+# %% ../notebooks/api/01_renderers.ipynb 17
+from torch.autograd.function import once_differentiable
+
+
+class _RecomputeSiddon(torch.autograd.Function):
+    """Render with Siddon's method chunk by chunk, without saving any intermediate tensors for autograd."""
+
+    @staticmethod
+    def forward(
+        ctx,
+        renderer,
+        volume,
+        source,
+        target,
+        img,
+        align_corners,
+        mask,
+        bounds,
+        n_channels,
+    ):
+        # Only the inputs are saved, the rays are traced again in the backward pass
+        ctx.renderer = renderer
+        ctx.align_corners = align_corners
+        ctx.bounds = bounds
+        ctx.n_channels = n_channels
+        ctx.save_for_backward(volume, source, target, img, mask)
+        with torch.no_grad():
+            return torch.cat(
+                [
+                    renderer._raytrace(
+                        volume,
+                        source,
+                        target[:, rays],
+                        img[..., rays],
+                        align_corners,
+                        mask,
+                        _slice_bounds(bounds, rays),
+                        n_channels,
+                    )
+                    for rays in _ray_chunks(target, renderer.recompute_chunk_size)
+                ],
+                dim=-1,
+            )
+
+    @staticmethod
+    @once_differentiable
+    def backward(ctx, grad):
+        volume, source, target, img, mask = ctx.saved_tensors
+        inputs = [
+            x.detach().requires_grad_(needs_grad)
+            for x, needs_grad in zip(
+                [volume, source, target, img], ctx.needs_input_grad[1:5]
+            )
+        ]
+        volume, source, target, img = inputs
+
+        # Retrace one chunk of rays at a time and accumulate the gradients of the inputs,
+        # such that only the graph of a single chunk is ever in memory
+        for rays in _ray_chunks(target, ctx.renderer.recompute_chunk_size):
+            with torch.enable_grad():
+                out = ctx.renderer._raytrace(
+                    volume,
+                    source,
+                    target[:, rays],
+                    img[..., rays],
+                    ctx.align_corners,
+                    mask,
+                    _slice_bounds(ctx.bounds, rays),
+                    ctx.n_channels,
+                )
+            if out.requires_grad:
+                out.backward(grad[..., rays])
+        grads = [x.grad if x.requires_grad else None for x in inputs]
+        return None, *grads, None, None, None, None
+
+
+def _ray_chunks(target, chunk_size):
+    """Split the rays of a batch into chunks of at most `chunk_size` rays."""
+    n_rays = target.shape[1]
+    return [slice(idx, idx + chunk_size) for idx in range(0, n_rays, chunk_size)]
+
+
+def _slice_bounds(bounds, rays):
+    """Get the integration bounds of a chunk of rays."""
+    if bounds is None:
+        return None
+    return tuple(bound[:, rays] if bound.dim() == 3 else bound for bound in bounds)
+
+# %% ../notebooks/api/01_renderers.ipynb 18
 from typing import Callable
 
 
@@ -178,7 +669,73 @@ def reduce(img, reducefn):
     else:
         raise ValueError(f"Only supports reducefn 'sum' or 'max', not {reducefn}")
 
-# %% ../notebooks/api/01_renderers.ipynb 11
+
+def reduce_packed(img, rays, shape, reducefn, channels=None):
+    """Combine packed segments into their rays (and optionally, into separate channels)."""
+    B, C, N = shape
+    if channels is None and C == 1:
+        idxs = rays
+    else:
+        b, n = rays // N, rays % N
+        c = 0 if channels is None else channels.flatten()
+        idxs = (b * C + c) * N + n
+    out = img.new_zeros(B * C * N)
+    if reducefn == "sum":
+        out = out.index_add(0, idxs, img.flatten())
+    elif reducefn == "max":
+        out = out.scatter_reduce(0, idxs, img.flatten(), "amax")
+    else:
+        raise ValueError(f"Only supports reducefn 'sum' or 'max', not {reducefn}")
+    return out.view(B, C, N)
+
+# %% ../notebooks/api/01_renderers.ipynb 19
+from torch.nn.functional import max_pool3d
+
+
+def _get_occupancy(density, brick_size, threshold=0.0, scale=None):
+    """Mark the bricks of `brick_size`^3 voxels that contain any voxel with density above a threshold."""
+    # The threshold is a physical density, so it is quantized like the density (if it is stored as integers)
+    if scale is not None:
+        threshold = threshold / scale
+    occupancy = max_pool3d(
+        (density.to(torch.float32) > threshold).to(torch.float32)[None, None],
+        kernel_size=brick_size,
+        stride=brick_size,
+        ceil_mode=True,
+    )
+
+    # Dilate the occupied bricks by one brick, such that the bounds of each ray are
+    # always in an empty brick (i.e., robust to roundoff error in the intersections)
+    occupancy = max_pool3d(occupancy, kernel_size=3, stride=1, padding=1)
+    return occupancy[0, 0]
+
+
+def _get_occupied_bounds(occupancy, source, target, brick_size, eps):
+    """Find the first and last intersections of each ray with an occupied brick."""
+    with torch.no_grad():
+        # Walk each ray through the coarse grid of bricks
+        dims = _constant(tuple(occupancy.shape), source.device).to(source)
+        source, target = source / brick_size, target / brick_size
+        alphas = _get_alphas_dda(source, target, dims, eps)
+
+        # Lookup whether the brick containing each segment is occupied
+        alphamid = (alphas[..., 0:-1] + alphas[..., 1:]) / 2
+        xyzs = _get_xyzs(alphamid, source, target, dims, eps, normalize=False)
+        occupied = _gather(occupancy[None], xyzs[:, 0], "nearest", False)[0] > 0
+        occupied = occupied & (alphas[..., 1:] > alphas[..., :-1])
+
+        # Rays that only cross empty bricks get an empty interval
+        alphamin = torch.where(occupied, alphas[..., :-1], torch.inf)
+        alphamax = torch.where(occupied, alphas[..., 1:], -torch.inf)
+        alphamin = alphamin.min(dim=-1, keepdim=True).values
+        alphamax = alphamax.max(dim=-1, keepdim=True).values
+        empty = ~occupied.any(dim=-1, keepdim=True)
+        alphamin = torch.where(empty, 0.0, alphamin)
+        alphamax = torch.where(empty, 0.0, alphamax)
+    return alphamin, alphamax
+
+# %% ../notebooks/api/01_renderers.ipynb 22
+@register_renderer("trilinear")
 class Trilinear(torch.nn.Module):
     """Differentiable X-ray renderer implemented with trilinear interpolation."""
 
@@ -187,14 +744,18 @@ class Trilinear(torch.nn.Module):
         mode: str = "bilinear",  # Interpolation mode for grid_sample
         reducefn: str = "sum",  # Function for combining samples along each ray
         eps: float = 1e-8,  # Small constant to avoid div by zero errors
+        lookup: str = "grid_sample",  # Sample voxels with "grid_sample" or by directly indexing the volume ("gather")
+        per_ray_bounds: bool = False,  # Sample each ray between its own intersections with the volume
     ):
         super().__init__()
         self.mode = mode
         self.reducefn = reducefn
         self.eps = eps
+        self.lookup = _check_lookup(lookup)
+        self.per_ray_bounds = per_ray_bounds
 
     def dims(self, volume):
-        return torch.tensor(volume.shape).to(volume)
+        return _constant(tuple(volume.shape[-3:]), volume.device)
 
     def forward(
         self,
@@ -207,42 +768,270 @@ class Trilinear(torch.nn.Module):
         mask=None,
         alphamin=None,
         alphamax=None,
+        n_channels=None,
     ):
-        dims = self.dims(volume)
+        dims = self.dims(volume).to(source)
 
         # Sample points along the rays and rescale to [-1, 1]
         if alphamin is None or alphamax is None:
             alphamin, alphamax = _get_alpha_minmax(source, target, dims, self.eps)
-            alphamin = alphamin.min()
-            alphamax = alphamax.max()
-        alphas = torch.linspace(0, 1, n_points)[None, None].to(volume)
+            if self.per_ray_bounds:
+                # Rays that miss the volume get an empty interval
+                alphamax = torch.maximum(alphamin, alphamax)
+            else:
+                alphamin = alphamin.min()
+                alphamax = alphamax.max()
+        alphas = torch.linspace(
+            0, 1, n_points, device=source.device, dtype=source.dtype
+        )[None, None]
         alphas = alphas * (alphamax - alphamin) + alphamin
 
         # Render the DRR
         # Get the XYZ coordinate of each alpha, normalized for grid_sample
-        xyzs = _get_xyzs(alphas, source, target, dims, self.eps)
+        xyzs = _get_xyzs(
+            alphas, source, target, dims, self.eps, self.lookup == "grid_sample"
+        )
 
-        # Sample the volume with trilinear interpolation
-        img = _get_voxel(volume, xyzs, img, self.mode, align_corners=align_corners)
+        # Sample the volume (and optionally, the mask) with trilinear interpolation
+        img, channels = _get_voxel_and_channel(
+            volume, mask, xyzs, img, self.mode, align_corners, self.lookup
+        )
 
         # Multiply by the step size to compute the rectangular rule for integration
         step_size = (alphamax - alphamin) / (n_points - 1)
         img = img * step_size
 
         # Handle optional masking
-        if mask is None:
+        if channels is None:
             img = reduce(img, self.reducefn)
             img = img.unsqueeze(1)
         else:
             B, D, _ = img.shape
-            C = int(mask.max().item() + 1)
-            channels = _get_voxel(
-                mask, xyzs, img=None, mode=self.mode, align_corners=align_corners
-            ).long()
-            img = (
-                torch.zeros(B, C, D)
-                .to(img)
-                .scatter_add_(1, channels.transpose(-1, -2), img.transpose(-1, -2))
+            C = n_channels or _n_channels(volume, mask)
+            img = img.new_zeros(B, C, D).scatter_add_(
+                1, channels.transpose(-1, -2), img.transpose(-1, -2)
             )
 
         return img
+
+# %% ../notebooks/api/01_renderers.ipynb 24
+import time
+
+
+def _test_rays(shape, n_rays, batch_size, generator):
+    """Rays through (and around) a volume, cast from sources on a sphere surrounding it."""
+    dims = torch.tensor(shape, dtype=torch.float32)
+    radius = 3 * dims.max()
+    direction = torch.randn(batch_size, 1, 3, generator=generator)
+    direction = direction / direction.norm(dim=-1, keepdim=True)
+    offsets = (
+        torch.rand(batch_size, n_rays, 3, generator=generator) - 0.5
+    ) * dims.max()
+    source = dims / 2 + radius * direction
+    target = dims / 2 - radius * direction + offsets
+    img = (target - source).norm(dim=-1).unsqueeze(1)
+    return source, target, img
+
+
+def _box_bounds(source, target, dims):
+    """Exact first and last intersections of each ray with the box [0, dims]."""
+    sdd = target - source
+    alpha0 = -source / sdd
+    alpha1 = (dims - source) / sdd
+    alphamin = torch.minimum(alpha0, alpha1).max(dim=-1, keepdim=True).values
+    alphamax = torch.maximum(alpha0, alpha1).min(dim=-1, keepdim=True).values
+    alphamin, alphamax = alphamin.clamp(0.0, 1.0), alphamax.clamp(0.0, 1.0)
+    return alphamin, torch.maximum(alphamin, alphamax)
+
+
+def check_renderer(
+    renderer: torch.nn.Module,  # Renderer to check (e.g., `get_renderer("siddon")`)
+    shape: tuple = (16, 20, 12),  # Shape of the test volume
+    n_rays: int = 64,  # Number of rays per pose
+    batch_size: int = 2,  # Number of poses
+    rtol: float = 0.05,  # Tolerance (relative to the longest ray) of the line integrals through a volume of ones
+    seed: int = 0,  # Seed for the random rays, density, and mask
+    **kwargs,  # Passed to the renderer
+):
+    """Check that a renderer follows the protocol used by `DRR` (raises an AssertionError if it does not)."""
+    generator = torch.Generator().manual_seed(seed)
+    source, target, img = _test_rays(shape, n_rays, batch_size, generator)
+    alphamin, alphamax = _box_bounds(source, target, torch.tensor(shape))
+
+    # The line integrals through a volume of ones are the lengths of the rays inside the volume
+    expected = img * (alphamax - alphamin).transpose(-1, -2)
+    tol = dict(rtol=rtol, atol=rtol * expected.max().item())
+    ones = torch.ones(shape)
+    out = renderer(ones, source, target, img, **kwargs)
+    assert out.shape == (
+        batch_size,
+        1,
+        n_rays,
+    ), f"Expected shape {(batch_size, 1, n_rays)}, got {tuple(out.shape)}"
+    torch.testing.assert_close(out, expected, **tol)
+
+    # Per-ray bounds (e.g., from the occupancy grid) around the volume do not change the image
+    out = renderer(
+        ones, source, target, img, alphamin=alphamin, alphamax=alphamax, **kwargs
+    )
+    torch.testing.assert_close(out, expected, **tol)
+
+    # Rendering the structures in a mask into separate channels partitions the image
+    density = torch.rand(shape, generator=generator)
+    mask = torch.randint(0, 3, shape, generator=generator).to(density)
+    out = renderer(density, source, target, img, **kwargs)
+    channels = renderer(density, source, target, img, mask=mask, n_channels=3, **kwargs)
+    assert channels.shape == (
+        batch_size,
+        3,
+        n_rays,
+    ), f"Expected shape {(batch_size, 3, n_rays)}, got {tuple(channels.shape)}"
+    torch.testing.assert_close(channels.sum(dim=1, keepdim=True), out)
+
+    # Gradients flow to the density and to the endpoints of the rays
+    density.requires_grad_(True)
+    target.requires_grad_(True)
+    renderer(density, source, target, img, **kwargs).sum().backward()
+    for name, x in [("density", density), ("target", target)]:
+        assert (
+            x.grad is not None and x.grad.isfinite().all()
+        ), f"Invalid gradient w.r.t. the {name}"
+        assert x.grad.abs().sum() > 0, f"Zero gradient w.r.t. the {name}"
+
+
+def benchmark_renderer(
+    renderer: torch.nn.Module,  # Renderer to time (e.g., `get_renderer("siddon")`)
+    shape: tuple = (128, 128, 128),  # Shape of the test volume
+    n_rays: int = 128 * 128,  # Number of rays per pose
+    batch_size: int = 1,  # Number of poses
+    n_repeats: int = 5,  # Number of timed renders (after one warmup render)
+    device: str = "cpu",  # Device on which to render
+    seed: int = 0,  # Seed for the random rays and density
+    **kwargs,  # Passed to the renderer
+) -> float:  # Mean time per render (in milliseconds)
+    """Time the inference of a renderer on random rays through a random volume."""
+    generator = torch.Generator().manual_seed(seed)
+    source, target, img = _test_rays(shape, n_rays, batch_size, generator)
+    density = torch.rand(shape, generator=generator)
+    args = [x.to(device) for x in (density, source, target, img)]
+
+    def synchronize():
+        if args[0].is_cuda:
+            torch.cuda.synchronize()
+
+    with torch.no_grad():
+        renderer(*args, **kwargs)
+        synchronize()
+        start = time.perf_counter()
+        for _ in range(n_repeats):
+            renderer(*args, **kwargs)
+        synchronize()
+    return (time.perf_counter() - start) / n_repeats * 1000
+
+# %% ../notebooks/api/01_renderers.ipynb 28
+def _siddon_system_matrix(shape, source, target, img, eps=1e-8):
+    """The entries (pose, pixel, voxel, length) of the Siddon system matrix of a batch of rays in voxel coordinates."""
+    dims = _constant(tuple(shape), source.device).to(source)
+    alphas = _get_alphas(source, target, dims, eps, True, shape=shape)
+    xyzs, lengths, img, rays = _pack(alphas, source, target, img, dims, eps, False)
+
+    # The voxel containing each segment is the one containing its midpoint
+    idxs = xyzs[0, 0, :, 0].floor().long()
+    inside = ((idxs >= 0) & (idxs < dims.long())).all(dim=-1)
+    X, Y, Z = shape
+    voxels = (idxs * _constant((Y * Z, Z, 1), idxs.device)).sum(dim=-1)
+
+    # Weight each segment by its length in world units
+    lengths = img[0, 0] * lengths[0, :, 0]
+    b, n = rays // target.shape[1], rays % target.shape[1]
+    return b[inside], n[inside], voxels[inside], lengths[inside]
+
+
+def _csr(rows, cols, values, size):
+    """Assemble a sparse CSR matrix from its (row, column, value) entries."""
+    order = (rows * size[1] + cols).argsort()
+    crow = torch.zeros(size[0] + 1, dtype=torch.int64, device=rows.device)
+    crow[1:] = torch.bincount(rows, minlength=size[0]).cumsum(dim=0)
+
+    # Products with 32-bit indices are faster (if the matrix is small enough to use them)
+    dtype = torch.int32 if max(len(values), *size) < 2**31 else torch.int64
+    return torch.sparse_csr_tensor(
+        crow.to(dtype),
+        cols[order].to(dtype),
+        values[order],
+        size,
+        check_invariants=False,
+    )
+
+
+class _SparseMatmul(torch.autograd.Function):
+    """Multiply by a sparse matrix, using its precomputed transpose in the backward pass."""
+
+    @staticmethod
+    def forward(ctx, x, matrix, matrix_t):
+        ctx.matrix_t = matrix_t
+        return matrix @ x
+
+    @staticmethod
+    @once_differentiable
+    def backward(ctx, grad):
+        return ctx.matrix_t @ grad, None, None
+
+
+class SystemMatrix(torch.nn.Module):
+    """Render a fixed set of rays with a precomputed (sparse) system matrix of their intersections with every voxel."""
+
+    def __init__(
+        self,
+        rows: torch.Tensor,  # Index of the ray of every entry
+        cols: torch.Tensor,  # Index of the (flattened) voxel of every entry
+        values: torch.Tensor,  # Length of the intersection of the ray with the voxel
+        n_rays: int,  # Total number of rays
+        volume_shape: tuple,  # Shape of the rendered volume (X, Y, Z)
+        shape: tuple,  # Shape of the rendered image (e.g., (B, 1, H, W))
+    ):
+        super().__init__()
+        n_voxels = math.prod(volume_shape)
+        self.register_buffer("matrix", _csr(rows, cols, values, (n_rays, n_voxels)))
+        self.register_buffer("matrix_t", _csr(cols, rows, values, (n_voxels, n_rays)))
+        self.volume_shape = tuple(volume_shape)
+        self.shape = tuple(shape)
+
+    @property
+    def nnz(self):
+        """The number of intersections of the rays with the voxels."""
+        return self.matrix._nnz()
+
+    def forward(self, density: torch.Tensor):
+        if density.shape != self.volume_shape:
+            raise ValueError(
+                f"Expected a volume of shape {self.volume_shape}, got {tuple(density.shape)}"
+            )
+        x = density.reshape(-1, 1).to(self.matrix.dtype)
+        return _SparseMatmul.apply(x, self.matrix, self.matrix_t).view(self.shape)
+
+    def save(self, path):
+        """Save the system matrix to disk."""
+        torch.save(
+            dict(
+                matrix=self.matrix,
+                volume_shape=self.volume_shape,
+                shape=self.shape,
+            ),
+            path,
+        )
+
+    @classmethod
+    def load(cls, path, map_location=None):
+        """Load a system matrix saved with `SystemMatrix.save`."""
+        state = torch.load(path, map_location=map_location)
+        matrix = state["matrix"].to_sparse_coo()
+        rows, cols = matrix.indices()
+        return cls(
+            rows,
+            cols,
+            matrix.values(),
+            matrix.shape[0],
+            state["volume_shape"],
+            state["shape"],
+        )